@@ -0,0 +1,83 @@
+'''
+AsyncTrader end to end against the local stand-ins: login over
+FakeSocketIO (on_connect loads accounts and offers and subscribes the
+models from the stand-in REST server), then price updates pushed through
+the socket thread to an async for consumer, and an Order update through
+stream_model and order_filled.
+
+login      - seconds from login() to on_connect done
+stream     - price updates per second reaching the consumer
+
+Run: python benchmarks/bench_async_stream.py [ticks]
+'''
+import asyncio
+import json
+import sys
+import time
+
+from local_server import FakeSocketIO, StandInServer, offline_trader
+
+from fxcm_rest_async import AsyncTrader
+
+
+async def run(url, count):
+    trader = offline_trader(url)
+    trader.socket_factory = FakeSocketIO
+    async with AsyncTrader(trader=trader) as client:
+        start = time.perf_counter()
+        response = await client.login(timeout=10)
+        print("login   %8.3f s" % (time.perf_counter() - start))
+        assert response['status'] is True, response
+        assert trader.ready.is_set() and trader.account_id == "1001"
+        assert "EUR/USD" in trader.symbol_info
+        on_connect = client._on_connect
+        trader.socketIO.disconnect()
+        assert (await client.login(timeout=10))['status'] is True
+        assert client._on_connect is on_connect, "on_connect wrapped twice"
+
+        socket = trader.socketIO
+        ticks = client.stream_prices("EUR/USD", maxsize=count)
+        first = asyncio.ensure_future(ticks.__anext__())
+        while "EUR/USD" not in client._streams:
+            await asyncio.sleep(0.01)
+        start = time.perf_counter()
+        for i in range(count):
+            socket.emit("EUR/USD", json.dumps(
+                {"Updated": 1504167080 + i, "Symbol": "EUR/USD",
+                 "Rates": [1.1 + i * 1e-6, 1.2, 1.3, 1.0]}))
+        last = (await first)['Updated']
+        received = 1
+        async for tick in ticks:
+            assert tick['Updated'] == last + 1, "out of order"
+            last = tick['Updated']
+            received += 1
+            if received == count:
+                break
+        rate = count / (time.perf_counter() - start)
+        await ticks.aclose()
+        print("stream  %8.0f ticks/s" % rate)
+        assert trader.symbols["EUR/USD"].updated == last
+
+        orders = client.stream_model("Order")
+        update = asyncio.ensure_future(orders.__anext__())
+        filled = asyncio.ensure_future(client.order_filled(7, timeout=5))
+        while "Order" not in client._streams:
+            await asyncio.sleep(0.01)
+        socket.emit("Order", json.dumps(
+            {"orderId": "7", "tradeId": "70", "accountId": "1001",
+             "currency": "EUR/USD", "isBuy": True, "amountK": 1,
+             "buy": 1.1, "sell": 1.0, "action": "I"}))
+        assert (await update)['orderId'] == "7"
+        assert await filled == "70"
+        await orders.aclose()
+        assert trader.handlers["Order"][0] == trader.update_handlers["Order"]
+        socket.disconnect()
+
+
+def main(count=20000):
+    with StandInServer() as server:
+        asyncio.run(run(server.url, count))
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:2]])
@@ -0,0 +1,63 @@
+'''
+REST calls and candles stored per get_candles request with candle_cache
+set, for a request next to the cached range and one years away from it.
+Only the uncovered part of each request may be downloaded; a request far
+from the cache must not fetch the gap in between.
+
+calls   - _request_candles calls made for the request
+stored  - candles held by the cache afterwards
+
+Run: python benchmarks/bench_candle_cache.py
+'''
+import shutil
+import tempfile
+
+from local_server import fxcm_rest_api, offline_trader
+
+PERIOD = 60
+
+
+def fake_history(calls):
+    '''
+    Stands in for Trader._request_candles with one m1 candle per minute.
+    '''
+    def request(instrument, period, num, From=None, To=None):
+        calls.append((From, To))
+        first = -(-From // PERIOD) * PERIOD
+        candles = [[t, 1.1, 1.1, 1.1, 1.1, 1.2, 1.2, 1.2, 1.2, 1]
+                   for t in range(first, To + 1, PERIOD)][-num:]
+        return dict(status=True, instrument_id=instrument, period_id=period,
+                    candles=candles)
+    return request
+
+
+def main():
+    path = tempfile.mkdtemp()
+    try:
+        trader = offline_trader("http://127.0.0.1")
+        trader.candle_store = fxcm_rest_api.CandleStore(path)
+        trader.symbol_info["EUR/USD"] = dict(offerId=1)
+        calls = []
+        trader._request_candles = fake_history(calls)
+        recent = fxcm_rest_api.to_timestamp("2020/01/01 00:00")
+        cases = [
+            ("seed (100 min)", 100, recent - 100 * PERIOD, recent),
+            ("cached", 10, recent - 50 * PERIOD, recent - 40 * PERIOD),
+            ("5 years away", 10, "2015/01/01 00:00", "2015/01/01 00:10"),
+            ("adjacent", 20, recent, recent + 20 * PERIOD),
+        ]
+        for name, num, From, To in cases:
+            del calls[:]
+            response = trader.get_candles("EUR/USD", "m1", num, From, To)
+            stored = len(trader.candle_store.read(1, PERIOD, 0, 2 ** 40))
+            print("%-15s %3d candles %4d calls %8d stored" % (
+                name, len(response['candles']), len(calls), stored))
+            assert response['status'] is True
+            assert len(calls) <= 1, "%s fetched the gap" % name
+        assert stored < 200, "the gap between requests was stored"
+    finally:
+        shutil.rmtree(path)
+
+
+if __name__ == '__main__':
+    main()
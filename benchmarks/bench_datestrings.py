@@ -0,0 +1,35 @@
+'''
+Datestring generation for get_candles(dt_fmt=...): the per row
+datetime.fromtimestamp(t).strftime(dt_fmt) loop against
+format_timestamps, on a 10,000 candle m1 page.
+
+Run: python benchmarks/bench_datestrings.py
+'''
+import timeit
+from datetime import datetime
+
+from local_server import fxcm_rest_api
+
+DT_FMT = "%Y/%m/%d %H:%M:%S"
+
+
+def per_row(timestamps, dt_fmt):
+    return [datetime.fromtimestamp(t).strftime(dt_fmt) for t in timestamps]
+
+
+def main(rows=10000, repeat=20):
+    timestamps = [1503694500 + i * 60 for i in range(rows)]
+    assert per_row(timestamps, DT_FMT) == fxcm_rest_api.format_timestamps(
+        timestamps, DT_FMT)
+    runs = (("per row loop", lambda: per_row(timestamps, DT_FMT)),
+            ("format_timestamps", lambda: fxcm_rest_api.format_timestamps(
+                timestamps, DT_FMT)),
+            ("format_timestamps UTC", lambda: fxcm_rest_api.format_timestamps(
+                timestamps, DT_FMT, "UTC")))
+    for name, fn in runs:
+        seconds = min(timeit.repeat(fn, number=1, repeat=repeat))
+        print("%-22s %8.2fms per %d rows" % (name, seconds * 1e3, rows))
+
+
+if __name__ == '__main__':
+    main()
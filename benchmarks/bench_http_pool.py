@@ -0,0 +1,49 @@
+'''
+Cold vs. warm per-call REST latency against a local stand-in server.
+
+cold - module level requests.post, a new connection for every call
+       (the behaviour of Trader._send_request before the pooled session)
+warm - Trader.send through the Trader owned keep-alive session
+
+Run: python benchmarks/bench_http_pool.py [calls]
+'''
+import sys
+import time
+
+import requests
+
+from local_server import StandInServer, offline_trader
+
+
+def timed(fn, calls):
+    samples = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return samples[len(samples) // 2], samples[int(len(samples) * 0.99)]
+
+
+def main(calls=500):
+    with StandInServer() as server:
+        trader = offline_trader(server.url)
+        url = server.url + "/trading/open_trade"
+        params = dict(account_id="1", symbol="EUR/USD", is_buy='true',
+                      amount=1)
+
+        def cold():
+            requests.post(url, headers=trader.HEADERS, data=params)
+
+        def warm():
+            trader.send("/trading/open_trade", params)
+
+        warm()
+        for name, fn in (("cold", cold), ("warm", warm)):
+            p50, p99 = timed(fn, calls)
+            print("%-5s p50=%8.1fus p99=%8.1fus" % (name, p50 * 1e6,
+                                                    p99 * 1e6))
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:2]])
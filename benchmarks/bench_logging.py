@@ -0,0 +1,80 @@
+'''
+Cost of logging on the order and tick paths.
+
+print      - a suppressed Trader.Print call (level ERROR), against the
+             previous implementation building its logger dict per call
+order      - on_order throughput at ERROR (suppressed), and at INFO
+             writing to a log file directly or through log_async
+tick       - on_price_update throughput at ERROR and INFO (it logs
+             nothing unless an update fails)
+
+Run: python benchmarks/bench_logging.py [messages]
+'''
+import logging
+import os
+import sys
+import tempfile
+import timeit
+
+from local_server import offline_trader
+from bench_socket_dispatch import RecordingSocket
+
+
+def dict_print(self, message, message_type=None, level='INFO', *args):
+    loggers = dict(INFO=self.logger.info,
+                   DEBUG=self.logger.debug,
+                   WARNING=self.logger.warning,
+                   ERROR=self.logger.error,
+                   CRITICAL=self.logger.critical)
+    if message_type is None or message_type not in self.ignore_output:
+        loggers[level](message, *args)
+
+
+def trader_for(level, log_async=False):
+    trader = offline_trader("http://127.0.0.1")
+    trader.logger.removeHandler(trader.ch)
+    trader.CONFIG['log_async'] = log_async
+    trader._log_init()
+    trader.ch.setStream(open(os.path.join(tempfile.mkdtemp(), "log.txt"),
+                             "w"))
+    trader.set_log_level(level)
+    trader.socketIO = RecordingSocket()
+    return trader
+
+
+def rate(function, messages):
+    return len(messages) / timeit.timeit(
+        lambda: [function(m) for m in messages], number=1)
+
+
+def main(count=100000):
+    trader = trader_for("ERROR")
+    message = {"orderId": "1", "action": "U"}
+    per_call = timeit.timeit(
+        lambda: trader.Print("Order Update: %s", "Order", "INFO", message),
+        number=count) / count
+    legacy = timeit.timeit(
+        lambda: dict_print(trader, "Order Update: %s", "Order", "INFO",
+                           message), number=count) / count
+    print("%-22s %8.0f ns/call" % ("print suppressed", per_call * 1e9))
+    print("%-22s %8.0f ns/call" % ("print suppressed (dict)", legacy * 1e9))
+
+    orders = [{"orderId": str(i % 500), "tradeId": str(i), "action": "U",
+               "currency": "EUR/USD", "amountK": 1} for i in range(count)]
+    ticks = [{"Updated": 1504167080 + i, "Symbol": "EUR/USD",
+              "Rates": [1.1, 1.2, 1.3, 1.0]} for i in range(count)]
+    for name, level, log_async in [("ERROR", "ERROR", False),
+                                   ("INFO", "INFO", False),
+                                   ("INFO log_async", "INFO", True)]:
+        trader = trader_for(level, log_async)
+        print("%-22s %8.0f msgs/s" % ("order " + name,
+                                       rate(trader.on_order, orders)))
+        print("%-22s %8.0f msgs/s" % ("tick " + name,
+                                       rate(trader.on_price_update, ticks)))
+        if trader.log_listener is not None:
+            trader.log_listener.stop()
+
+
+if __name__ == '__main__':
+    logging.raiseExceptions = True
+    main(*[int(a) for a in sys.argv[1:2]])
@@ -0,0 +1,102 @@
+'''
+Trader.on_price_update throughput and memory churn per tick, against
+the handler it replaced (which built a p_up dict and a new PriceUpdate
+on every tick).
+
+ticks/s    - price messages handled per second
+bytes/tick - peak memory allocated while handling one tick, measured
+             with tracemalloc with the JSON decoding taken out
+
+Run: python benchmarks/bench_price_update.py [ticks]
+'''
+import json
+import sys
+import time
+import tracemalloc
+
+from local_server import fxcm_rest_api, offline_trader
+
+SYMBOLS = ["EUR/USD", "USD/JPY", "GBP/USD", "AUD/USD"]
+
+
+def legacy_on_price_update(self, msg):
+    try:
+        md = json.loads(msg)
+        symbol = md["Symbol"]
+        symbol_info = self.symbol_info.get(symbol, {})
+        p_up = dict(symbol_info=self.symbol_info[symbol], parent=self)
+        self.symbols[symbol] = self.symbols.get(symbol, fxcm_rest_api
+                                                .PriceUpdate(
+                                                    p_up,
+                                                    symbol_info=symbol_info))
+        self.symbols[symbol].bid, self.symbols[symbol].ask,\
+            self.symbols[symbol].high,\
+            self.symbols[symbol].low = md['Rates']
+        self.symbols[symbol].updated = md['Updated']
+    except Exception as e:
+        self.logger.error("Can't handle price update: " + str(e))
+
+
+def messages(count):
+    return [json.dumps({"Updated": 1504167080 + i,
+                        "Rates": [1.1 + i * 1e-5, 1.2, 1.3, 1.0],
+                        "Symbol": SYMBOLS[i % len(SYMBOLS)]})
+            for i in range(count)]
+
+
+class PreDecoded(object):
+    '''
+    Stands in for the json module and for Trader.decode, handing back
+    messages decoded up front so only the handler's own allocations are
+    traced.
+    '''
+    def __init__(self, msgs):
+        self.decoded = dict((msg, json.loads(msg)) for msg in msgs)
+
+    def loads(self, msg):
+        return self.decoded[msg]
+
+
+def measure(trader, handler, msgs):
+    for msg in msgs[:len(SYMBOLS)]:
+        handler(msg)
+    start = time.perf_counter()
+    for msg in msgs:
+        handler(msg)
+    rate = len(msgs) / (time.perf_counter() - start)
+    sample = msgs[:1000]
+    module, stdlib_json = sys.modules[__name__], json
+    decoder = PreDecoded(sample)
+    module.json = fxcm_rest_api.json = decoder
+    trader.decode = decoder.loads
+    tracemalloc.start()
+    peaks = []
+    try:
+        for msg in sample:
+            before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            handler(msg)
+            peaks.append(tracemalloc.get_traced_memory()[1] - before)
+    finally:
+        tracemalloc.stop()
+        module.json = fxcm_rest_api.json = stdlib_json
+        trader.decode = fxcm_rest_api.DECODER
+    return rate, sum(peaks) / float(len(peaks))
+
+
+def main(count=200000):
+    msgs = messages(count)
+    for name in ("before", "after"):
+        trader = offline_trader("http://127.0.0.1")
+        for i, symbol in enumerate(SYMBOLS):
+            trader.symbol_info[symbol] = dict(offerId=i, currency=symbol,
+                                              ratePrecision=5)
+        handler = trader.on_price_update
+        if name == "before":
+            handler = trader.add_method(legacy_on_price_update)
+        rate, churn = measure(trader, handler, msgs)
+        print("%-6s %10.0f ticks/s %8.0f bytes/tick" % (name, rate, churn))
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:2]])
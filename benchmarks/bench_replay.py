@@ -0,0 +1,51 @@
+'''
+Handler throughput replaying a recorded socket stream (mixed Offer /
+Order / price updates) through the Trader's default handlers.
+
+record     - recording the stream with TickRecorder
+replay     - Trader.replay at full speed, through the registered handlers
+direct     - the same messages called on the handlers from memory
+
+Run: python benchmarks/bench_replay.py [messages]
+'''
+import os
+import sys
+import tempfile
+import time
+
+from bench_socket_dispatch import stream, trader_for, run
+from fxcm_recorder import TickRecorder  # noqa: E402, on local_server's path
+
+try:
+    import orjson
+    decode = orjson.loads
+except ImportError:
+    import json
+    decode = json.loads
+
+
+def main(count=200000):
+    msgs = stream(count)
+    path = os.path.join(tempfile.mkdtemp(), "ticks.rec")
+    recorder = TickRecorder(path)
+    start = time.perf_counter()
+    received = time.time()
+    for i, (event, msg) in enumerate(msgs):
+        recorder.write(event, msg, received + i * 1e-4)
+    recorder.close()
+    print("%-8s %10.0f msgs/s  %.1f bytes/msg" % (
+        "record", count / (time.perf_counter() - start),
+        os.path.getsize(path) / float(count)))
+    trader = trader_for(decode)
+    start = time.perf_counter()
+    replayed = trader.replay(path)
+    print("%-8s %10.0f msgs/s" % (
+        "replay", replayed / (time.perf_counter() - start)))
+    trader = trader_for(decode)
+    print("%-8s %10.0f msgs/s" % ("direct", run(trader.socketIO.handlers,
+                                                 msgs)))
+    os.remove(path)
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:2]])
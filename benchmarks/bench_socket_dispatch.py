@@ -0,0 +1,96 @@
+'''
+Socket message throughput for a mixed Offer / Order / price stream
+through the Trader's default handlers.
+
+raw        - handlers called with the raw payload, decoding it themselves
+stdlib     - decode-once dispatch with json.loads
+orjson     - decode-once dispatch with orjson.loads (if installed)
+
+Run: python benchmarks/bench_socket_dispatch.py [messages]
+'''
+import json
+import sys
+import time
+
+from local_server import offline_trader
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class RecordingSocket(object):
+    '''
+    Stands in for SocketIO, keeping the registered handlers.
+    '''
+    def __init__(self):
+        self.handlers = {}
+
+    def on(self, event, handler):
+        self.handlers[event] = handler
+
+    def off(self, event):
+        self.handlers.pop(event, None)
+
+
+def stream(count):
+    offer = {"t": 0, "ratePrecision": 5, "offerId": 1, "rates": [1.1, 1.2],
+             "currency": "EUR/USD", "sell": 1.10001, "buy": 1.10011,
+             "high": 1.101, "low": 1.099, "volume": 100, "time": "1504167080"}
+    order = {"t": 0, "ratePrecision": 5, "orderId": "1", "tradeId": "2",
+             "accountId": "100", "currency": "EUR/USD", "isBuy": True,
+             "amountK": 1, "status": 1, "type": "OM", "action": "U"}
+    msgs = []
+    for i in range(count):
+        kind = i % 4
+        if kind == 0:
+            offer['sell'] += 1e-5
+            msgs.append(("Offer", json.dumps(offer)))
+        elif kind == 1:
+            order['orderId'] = str(i % 500)
+            msgs.append(("Order", json.dumps(order)))
+        else:
+            msgs.append(("EUR/USD", json.dumps(
+                {"Updated": 1504167080 + i, "Symbol": "EUR/USD",
+                 "Rates": [1.1 + i * 1e-6, 1.2, 1.3, 1.0]})))
+    return msgs
+
+
+def trader_for(decode):
+    trader = offline_trader("http://127.0.0.1")
+    trader.socketIO = RecordingSocket()
+    trader.send = lambda *args, **kwargs: {'status': True}
+    trader.symbol_info["EUR/USD"] = dict(offerId=1, currency="EUR/USD",
+                                         ratePrecision=5)
+    trader.decode = decode
+    trader.subscribe("Offer", trader.on_offer)
+    trader.subscribe("Order", trader.on_order)
+    trader.subscribe_symbol("EUR/USD")
+    return trader
+
+
+def run(handlers, msgs):
+    start = time.perf_counter()
+    for event, msg in msgs:
+        handlers[event](msg)
+    return len(msgs) / (time.perf_counter() - start)
+
+
+def main(count=200000):
+    msgs = stream(count)
+    trader = trader_for(json.loads)
+    raw = {"Offer": trader.on_offer, "Order": trader.on_order,
+           "EUR/USD": trader.on_price_update}
+    print("%-8s %10.0f msgs/s" % ("raw", run(raw, msgs)))
+    decoders = [("stdlib", json.loads)]
+    if orjson is not None:
+        decoders.append(("orjson", orjson.loads))
+    for name, decode in decoders:
+        trader = trader_for(decode)
+        print("%-8s %10.0f msgs/s" % (name, run(trader.socketIO.handlers,
+                                                 msgs)))
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:2]])
@@ -0,0 +1,139 @@
+'''
+Local stand-in for the FXCM trading host, used by the benchmarks.
+Answers every GET/POST with an executed REST response over HTTP/1.1 so
+connections can be kept alive between calls; get_model requests get the
+MODELS records. FakeSocketIO stands in for the socket.io client, so
+login, on_connect and subscriptions run without a network.
+'''
+import json
+import os
+import queue
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+import fxcm_rest_api_token as fxcm_rest_api  # noqa: E402
+
+# model name -> records answered by /trading/get_model
+MODELS = {
+    "Account": [{"accountId": "1001", "balance": 50000}],
+    "Offer": [{"offerId": 1, "currency": "EUR/USD", "ratePrecision": 5,
+               "sell": 1.10001, "buy": 1.10011, "pip": 0.0001},
+              {"offerId": 2, "currency": "USD/JPY", "ratePrecision": 3,
+               "sell": 109.321, "buy": 109.326, "pip": 0.01}],
+}
+# model name -> field of its records in the get_model response
+MODEL_FIELDS = {"Offer": "offers", "Account": "accounts", "Order": "orders",
+                "OpenPosition": "open_positions",
+                "ClosedPosition": "closed_positions", "Summary": "summary",
+                "LeverageProfile": "leverage_profile",
+                "Properties": "properties"}
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    delay = 0.0
+
+    def _reply(self):
+        length = int(self.headers.get('Content-Length', 0) or 0)
+        if length:
+            self.rfile.read(length)
+        if self.delay:
+            threading.Event().wait(self.delay)
+        reply = {"response": {"executed": True, "error": ""},
+                 "data": {"orderId": "1"}}
+        url = urlsplit(self.path)
+        if url.path == "/trading/get_model":
+            for model in parse_qs(url.query).get('models', []):
+                reply[MODEL_FIELDS[model]] = MODELS.get(model, [])
+        body = json.dumps(reply).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = _reply
+    do_POST = _reply
+
+    def log_message(self, *args):
+        pass
+
+
+class StandInServer(object):
+    '''
+    Context manager running StandInHandler on a random local port.
+    delay adds a fixed server-side processing time per request.
+    '''
+    def __init__(self, delay=0.0):
+        handler = type('Handler', (StandInHandler,), {'delay': delay})
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        self.httpd.daemon_threads = True
+        self.url = "http://127.0.0.1:%d" % self.httpd.server_address[1]
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def __exit__(self, *err):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def offline_trader(url, **kwargs):
+    '''
+    Returns a Trader wired to url without a socket connection.
+    '''
+    config = os.path.join(os.path.dirname(__file__), os.pardir,
+                          "fxcm_rest.json")
+    trader = fxcm_rest_api.Trader('TOKEN', 'demo', config_file=config,
+                                  **kwargs)
+    trader._log_init()
+    trader.environment = dict(trader.environment, trading=url)
+    trader.bearerGen = lambda: "Bearer TOKEN"
+    return trader
+
+
+class FakeSocketIO(object):
+    '''
+    Stands in for socketIO_client.SocketIO, built the same way (set
+    Trader.socket_factory = FakeSocketIO). wait, run by login on the
+    socket thread, connects and then delivers what emit queues, in order,
+    until disconnect.
+    '''
+    def __init__(self, host=None, port=None, params=None):
+        self.handlers = {}
+        self._engineIO_session = type('Session', (object,), {'id': 'FAKE'})
+        self._queue = queue.Queue()
+
+    def on(self, event, handler):
+        self.handlers[event] = handler
+
+    def off(self, event):
+        self.handlers.pop(event, None)
+
+    def emit(self, event, payload):
+        '''
+        Queues payload (a str) for the handler of event, as if received.
+        '''
+        self._queue.put((event, payload))
+
+    def disconnect(self):
+        self._queue.put(('disconnect', None))
+
+    def wait(self, seconds=None):
+        self.handlers['connect']()
+        while True:
+            event, payload = self._queue.get()
+            if event == 'disconnect':
+                self.handlers.get('disconnect', lambda: None)()
+                return
+            handler = self.handlers.get(event)
+            if handler is not None:
+                handler(payload)
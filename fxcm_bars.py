@@ -0,0 +1,76 @@
+from collections import deque
+
+
+class BarAggregator(object):
+    '''Builds bars of one period for one symbol from live price updates.
+    Bars use the get_candles layout:
+    [timestamp, bidopen, bidclose, bidhigh, bidlow,
+     askopen, askclose, askhigh, asklow, tickqty]
+    where timestamp is the start of the bar.
+
+    A bar is complete once a price update for a later bar arrives; it is
+    then appended to bars and passed to on_bar(bar). Bar boundaries are
+    aligned to the seed candles when seeded, otherwise to the epoch.
+    '''
+
+    def __init__(self, seconds, history=1000, on_bar=None):
+        '''
+        :param seconds: bar length in seconds
+        :param history: completed bars kept in bars
+        :param on_bar: * Optional * function called with each completed bar
+        '''
+        self.seconds = seconds
+        self.offset = 0
+        self.bars = deque(maxlen=history)
+        self.current = None
+        self.on_bar = on_bar
+
+    def seed(self, candles):
+        '''
+        Starts from historical candles as returned by get_candles, oldest
+        first. The last candle is taken as the bar still in progress.
+
+        :param candles: list of candles
+        :return: None
+        '''
+        if not candles:
+            return
+        candles = [list(candle[:10]) for candle in candles]
+        self.offset = candles[-1][0] % self.seconds
+        self.bars.extend(candles[:-1])
+        self.current = candles[-1]
+
+    def update(self, updated, bid, ask):
+        '''
+        Adds a price update.
+
+        :param updated: update timestamp in seconds
+        :param bid:
+        :param ask:
+        :return: the bar completed by this update, or None
+        '''
+        start = updated - (updated - self.offset) % self.seconds
+        bar = self.current
+        if bar is not None and start == bar[0]:
+            bar[2] = bid
+            if bid > bar[3]:
+                bar[3] = bid
+            if bid < bar[4]:
+                bar[4] = bid
+            bar[6] = ask
+            if ask > bar[7]:
+                bar[7] = ask
+            if ask < bar[8]:
+                bar[8] = ask
+            bar[9] += 1
+            return None
+        if bar is not None and start < bar[0]:
+            # late update for a bar already closed
+            return None
+        self.current = [start, bid, bid, bid, bid, ask, ask, ask, ask, 1]
+        if bar is None:
+            return None
+        self.bars.append(bar)
+        if self.on_bar is not None:
+            self.on_bar(bar)
+        return bar
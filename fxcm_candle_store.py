@@ -0,0 +1,121 @@
+import json
+import os
+import threading
+
+import numpy as np
+
+
+class CandleStore(object):
+    '''On disk candle cache used behind Trader.get_candles.
+    Candles for each (offerId, period) are kept as a time ordered NumPy
+    structured array in a .npy file, read back memory mapped, together
+    with a small .json file holding the time ranges the file covers, as
+    sorted disjoint segments. Ranges inside the coverage are answered
+    from disk; only the parts not covered have to be downloaded, so a
+    request far from what is stored does not fetch the gap in between.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        self._lock = threading.Lock()
+        self._mapped = {}
+
+    def _file(self, offer_id, period, ext):
+        # periods are keyed by their length in seconds, as "m1" and "M1"
+        # would collide on case insensitive file systems
+        return os.path.join(self.path, "%s_%s.%s" % (offer_id, period, ext))
+
+    def coverage(self, offer_id, period):
+        '''
+        Returns the sorted, disjoint [start, end] timestamp segments held
+        for offer_id and period (empty if nothing is stored).
+        '''
+        try:
+            with open(self._file(offer_id, period, 'json'), 'r') as f:
+                meta = json.load(f)
+        except (IOError, ValueError):
+            return []
+        if 'segments' in meta:
+            return [tuple(segment) for segment in meta['segments']]
+        if 'start' in meta and 'end' in meta:
+            # files written before segments were kept
+            return [(meta['start'], meta['end'])]
+        return []
+
+    def missing(self, offer_id, period, start, end):
+        '''
+        Returns the (start, end) ranges of start to end that are not
+        covered yet and must be downloaded.
+        '''
+        gaps = []
+        overlaps = False
+        for low, high in self.coverage(offer_id, period):
+            if high < start:
+                continue
+            if low > end:
+                break
+            overlaps = True
+            if low > start:
+                gaps.append((start, low))
+            start = max(start, high)
+        if start < end or not overlaps:
+            gaps.append((start, end))
+        return gaps
+
+    def read(self, offer_id, period, start, end):
+        '''
+        Returns a read only, memory mapped view of the stored candles with
+        start <= timestamp <= end.
+        '''
+        with self._lock:
+            candles = self._mapped.get((offer_id, period))
+            if candles is None:
+                try:
+                    candles = np.load(self._file(offer_id, period, 'npy'),
+                                      mmap_mode='r')
+                except IOError:
+                    return None
+                self._mapped[(offer_id, period)] = candles
+        timestamps = candles['timestamp']
+        first = np.searchsorted(timestamps, start, 'left')
+        last = np.searchsorted(timestamps, end, 'right')
+        return candles[first:last]
+
+    def add(self, offer_id, period, start, end, candles):
+        '''
+        Merges candles (a structured array with a timestamp field) that
+        cover start to end into the store, joining the segments start to
+        end overlaps or touches. Where timestamps repeat, the new candle
+        replaces the stored one.
+        '''
+        with self._lock:
+            data_file = self._file(offer_id, period, 'npy')
+            segments = []
+            if os.path.exists(data_file):
+                # new candles first, so np.unique keeps them
+                candles = np.concatenate([candles, np.load(data_file)])
+                for low, high in self.coverage(offer_id, period):
+                    if high < start or low > end:
+                        segments.append((low, high))
+                    else:
+                        start = min(start, low)
+                        end = max(end, high)
+            segments.append((start, end))
+            segments.sort()
+            unique, index = np.unique(candles['timestamp'],
+                                      return_index=True)
+            candles = candles[index]
+            self._mapped.pop((offer_id, period), None)
+            self._replace(data_file, lambda f: np.save(f, candles))
+            self._replace(self._file(offer_id, period, 'json'),
+                          lambda f: f.write(json.dumps(
+                              dict(segments=segments)).encode()))
+
+    @staticmethod
+    def _replace(name, write):
+        temp = name + '.tmp'
+        with open(temp, 'wb') as f:
+            write(f)
+        os.replace(temp, name)
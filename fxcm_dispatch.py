@@ -0,0 +1,305 @@
+import logging
+from collections import deque
+import queue
+import threading
+import time
+
+
+class Conflator(object):
+    '''Hands the newest message per key to handler on its own thread.
+    put() only stores the message, so a slow handler never holds up the
+    socket thread. Messages that are replaced before being delivered are
+    dropped and counted. After each round of deliveries the thread waits
+    interval seconds, so handler sees at most one message per key per
+    interval (interval 0: whenever handler is ready for more).
+    '''
+
+    def __init__(self, handler, interval=0, name='conflator'):
+        self.handler = handler
+        self.interval = interval
+        self.delivered = {}
+        self.dropped = {}
+        self._latest = {}
+        self._running = True
+        self._ready = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name=name)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def put(self, key, message):
+        '''
+        Stores message as the newest for key, replacing any undelivered one.
+        '''
+        with self._ready:
+            if key in self._latest:
+                self.dropped[key] = self.dropped.get(key, 0) + 1
+            self._latest[key] = message
+            self._ready.notify()
+
+    def stats(self):
+        '''
+        Returns {key: {'delivered': count, 'dropped': count}}
+        '''
+        with self._ready:
+            keys = set(self.delivered) | set(self.dropped)
+            return dict((key, {'delivered': self.delivered.get(key, 0),
+                               'dropped': self.dropped.get(key, 0)})
+                        for key in keys)
+
+    def stop(self):
+        with self._ready:
+            self._running = False
+            self._ready.notify()
+
+    def _run(self):
+        while True:
+            with self._ready:
+                while self._running and not self._latest:
+                    self._ready.wait()
+                if not self._running:
+                    return
+                pending, self._latest = self._latest, {}
+                for key in pending:
+                    self.delivered[key] = self.delivered.get(key, 0) + 1
+            for message in pending.values():
+                try:
+                    self.handler(message)
+                except Exception as e:
+                    logging.error("Conflated handler failed: %s" % e)
+            if self.interval:
+                time.sleep(self.interval)
+
+
+class _Topic(object):
+    def __init__(self, name, policy, maxsize):
+        self.name = name
+        self.policy = policy
+        self.maxsize = maxsize
+        self.items = deque()
+        # True while waiting in the ready queue or being served, so that
+        # only one worker at a time handles a topic, keeping its order
+        self.scheduled = False
+        self.enqueued = 0
+        self.handled = 0
+        self.dropped = 0
+        self.max_depth = 0
+        self.lag_total = 0.0
+        self.lag_max = 0.0
+
+
+class Dispatcher(object):
+    '''Runs socket handlers on a pool of worker threads.
+    Each topic (socket event) has its own bounded queue, handled by one
+    worker at a time so its messages keep their order, while different
+    topics are handled in parallel. What happens when a queue is full is
+    set per topic:
+    block - put() waits for space (the socket reader waits too)
+    drop-oldest - the oldest queued message is dropped
+    conflate - only the newest message is kept, whatever maxsize is
+    '''
+    POLICIES = ('block', 'drop-oldest', 'conflate')
+    # topics are socket events, not message keys
+    keyed = False
+
+    def __init__(self, workers=4, maxsize=1000, policy='block',
+                 policies=None, name='dispatch'):
+        '''
+        :param workers: worker threads
+        :param maxsize: default queue size per topic
+        :param policy: default overflow policy
+        :param policies: * Optional * Dict of topic: policy overrides
+        :param name: thread name prefix
+        '''
+        for topic_policy in [policy] + list((policies or {}).values()):
+            if topic_policy not in self.POLICIES:
+                raise ValueError("Unknown overflow policy %s" % topic_policy)
+        self.maxsize = maxsize
+        self.policy = policy
+        self.policies = dict(policies or {})
+        self._topics = {}
+        self._ready = deque()
+        self._running = True
+        self._lock = threading.Lock()
+        self._work_ready = threading.Condition(self._lock)
+        self._space = threading.Condition(self._lock)
+        self._threads = []
+        for i in range(workers):
+            thread = threading.Thread(target=self._work,
+                                      name="%s-%d" % (name, i))
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def set_policy(self, topic, policy, maxsize=None):
+        '''
+        Sets the overflow policy (and optionally queue size) of topic.
+        '''
+        if policy not in self.POLICIES:
+            raise ValueError("Unknown overflow policy %s" % policy)
+        with self._lock:
+            self.policies[topic] = policy
+            queue = self._topics.get(topic)
+            if queue is not None:
+                queue.policy = policy
+                queue.maxsize = maxsize or queue.maxsize
+            elif maxsize is not None:
+                self._topics[topic] = _Topic(topic, policy, maxsize)
+
+    def put(self, topic, handler, message):
+        '''
+        Queues handler(message) on topic.
+        '''
+        queued = time.time()
+        with self._lock:
+            queue = self._topics.get(topic)
+            if queue is None:
+                queue = self._topics[topic] = _Topic(
+                    topic, self.policies.get(topic, self.policy),
+                    self.maxsize)
+            if queue.policy == 'conflate':
+                queue.dropped += len(queue.items)
+                queue.items.clear()
+            elif len(queue.items) >= queue.maxsize:
+                if queue.policy == 'drop-oldest':
+                    queue.items.popleft()
+                    queue.dropped += 1
+                else:
+                    while self._running and \
+                            len(queue.items) >= queue.maxsize:
+                        self._space.wait()
+            queue.items.append((handler, message, queued))
+            queue.enqueued += 1
+            if len(queue.items) > queue.max_depth:
+                queue.max_depth = len(queue.items)
+            if not queue.scheduled:
+                queue.scheduled = True
+                self._ready.append(queue)
+                self._work_ready.notify()
+
+    def stats(self):
+        '''
+        Returns {topic: {'depth', 'max_depth', 'enqueued', 'handled',
+        'dropped', 'lag_avg', 'lag_max'}}, lag being the seconds messages
+        waited in the queue.
+        '''
+        with self._lock:
+            return dict((name, {
+                'depth': len(queue.items),
+                'max_depth': queue.max_depth,
+                'enqueued': queue.enqueued,
+                'handled': queue.handled,
+                'dropped': queue.dropped,
+                'lag_avg': queue.lag_total / queue.handled
+                if queue.handled else 0.0,
+                'lag_max': queue.lag_max})
+                for name, queue in self._topics.items())
+
+    def stop(self):
+        with self._lock:
+            self._running = False
+            self._work_ready.notify_all()
+            self._space.notify_all()
+
+    def _work(self):
+        while True:
+            with self._lock:
+                while self._running and not self._ready:
+                    self._work_ready.wait()
+                if not self._running:
+                    return
+                queue = self._ready.popleft()
+                handler, message, queued = queue.items.popleft()
+                self._space.notify_all()
+                lag = time.time() - queued
+                queue.handled += 1
+                queue.lag_total += lag
+                if lag > queue.lag_max:
+                    queue.lag_max = lag
+            try:
+                handler(message)
+            except Exception as e:
+                logging.error("%s handler failed: %s" % (queue.name, e))
+            with self._lock:
+                if queue.items:
+                    self._ready.append(queue)
+                    self._work_ready.notify()
+                else:
+                    queue.scheduled = False
+
+
+class ShardedDispatcher(object):
+    '''Runs handlers on a fixed set of worker threads (shards), each with
+    its own bounded queue. A message goes to the shard its key hashes to,
+    so messages with the same key (symbol, orderId, ...) are handled in
+    order, one at a time, while other keys are handled in parallel. put()
+    waits when the shard's queue is full.
+    '''
+    # Trader keys model updates by record id rather than by event
+    keyed = True
+
+    def __init__(self, shards=4, maxsize=1000, name='shard'):
+        '''
+        :param shards: worker threads
+        :param maxsize: queue size per shard
+        :param name: thread name prefix
+        '''
+        self._queues = [queue.Queue(maxsize) for i in range(shards)]
+        self._stats = [{'handled': 0, 'lag_total': 0.0, 'lag_max': 0.0}
+                       for i in range(shards)]
+        self._threads = []
+        for i in range(shards):
+            thread = threading.Thread(target=self._work, args=(i,),
+                                      name="%s-%d" % (name, i))
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def shard(self, key):
+        '''
+        Returns the index of the shard handling key.
+        '''
+        return hash(key) % len(self._queues)
+
+    def put(self, key, handler, message):
+        '''
+        Queues handler(message) on the shard of key.
+        '''
+        self._queues[hash(key) % len(self._queues)].put(
+            (handler, message, time.time()))
+
+    def stats(self):
+        '''
+        Returns {shard: {'depth', 'handled', 'lag_avg', 'lag_max'}}, lag
+        being the seconds messages waited in the queue.
+        '''
+        stats = {}
+        for i, shard in enumerate(self._stats):
+            handled = shard['handled']
+            stats[i] = {'depth': self._queues[i].qsize(),
+                        'handled': handled,
+                        'lag_avg': shard['lag_total'] / handled
+                        if handled else 0.0,
+                        'lag_max': shard['lag_max']}
+        return stats
+
+    def stop(self):
+        for shard in self._queues:
+            shard.put(None)
+
+    def _work(self, index):
+        shard = self._queues[index]
+        stats = self._stats[index]
+        while True:
+            item = shard.get()
+            if item is None:
+                return
+            handler, message, queued = item
+            lag = time.time() - queued
+            stats['handled'] += 1
+            stats['lag_total'] += lag
+            if lag > stats['lag_max']:
+                stats['lag_max'] = lag
+            try:
+                handler(message)
+            except Exception as e:
+                logging.error("Shard %d handler failed: %s" % (index, e))
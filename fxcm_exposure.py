@@ -0,0 +1,193 @@
+import logging
+import threading
+
+
+class ExposureTracker(object):
+    '''Currency exposure per account, kept current from position and
+    order updates. A position or order for amountK of a pair is split
+    into its currencies through symbol_info: buying EUR/USD at rate adds
+    amountK * 1000 EUR and takes amountK * 1000 * rate USD, selling does
+    the opposite. Instruments without a quote currency (eg. CFDs) count
+    in the instrument itself.
+
+    exposure - {accountId: {currency: amount}} of open positions
+    pending - {accountId: {currency: amount}} of open orders
+
+    Each update moves the totals by the change of its position or order,
+    so reads and updates are O(1). Thresholds call back when the absolute
+    position exposure of a currency goes over a limit and when it comes
+    back within it.
+    '''
+
+    def __init__(self, symbol_info):
+        '''
+        :param symbol_info: Dict of symbol: offer, eg. Trader.symbol_info
+        '''
+        self.symbol_info = symbol_info
+        self.exposure = {}
+        self.pending = {}
+        self._legs = {}
+        self._thresholds = {}
+        self._breached = set()
+        self._lock = threading.Lock()
+
+    def _split(self, symbol):
+        info = self.symbol_info.get(symbol) or {}
+        currencies = info.get('currency', symbol).split('/')
+        if len(currencies) == 2:
+            return currencies[0], currencies[1]
+        return currencies[0], None
+
+    def _legs_of(self, record, rate_field):
+        symbol = record.get('currency')
+        amount = record.get('amountK')
+        rate = record.get(rate_field)
+        if symbol is None or amount is None:
+            return ()
+        base, quote = self._split(symbol)
+        units = float(amount) * 1000
+        if not record.get('isBuy'):
+            units = -units
+        if quote is None or not rate:
+            return ((base, units),)
+        return ((base, units), (quote, -units * float(rate)))
+
+    def _apply(self, key, book, account_id, legs, changed):
+        old = self._legs.pop(key, None)
+        if old is not None:
+            old_book, old_account, old_legs = old
+            totals = old_book.get(old_account, {})
+            for currency, amount in old_legs:
+                totals[currency] = totals.get(currency, 0.0) - amount
+                changed.add((old_book is self.exposure, old_account,
+                             currency))
+        if not legs:
+            return
+        self._legs[key] = (book, account_id, legs)
+        totals = book.get(account_id)
+        if totals is None:
+            totals = book[account_id] = {}
+        for currency, amount in legs:
+            totals[currency] = totals.get(currency, 0.0) + amount
+            changed.add((book is self.exposure, account_id, currency))
+
+    def _update(self, key, book, record, rate_field):
+        changed = set()
+        with self._lock:
+            legs = self._legs_of(record, rate_field) if record else ()
+            self._apply(key, book, (record or {}).get('accountId'), legs,
+                        changed)
+            events = self._crossings(changed)
+        self._notify(events)
+
+    def position(self, trade_id, record):
+        '''
+        Sets the exposure of an open position from its OpenPosition
+        record (currency, accountId, isBuy, amountK, open), or removes it
+        when record is None.
+        '''
+        self._update(('position', trade_id), self.exposure, record, 'open')
+
+    def order(self, order_id, record):
+        '''
+        Sets the pending exposure of an open order from its Order record
+        (currency, accountId, isBuy, amountK, buy / sell rate), or
+        removes it when record is None.
+        '''
+        if record is not None:
+            record = self._order_record(record)
+        self._update(('order', order_id), self.pending, record, 'rate')
+
+    @staticmethod
+    def _order_record(record):
+        return dict(record, rate=record.get(
+            'buy' if record.get('isBuy') else 'sell'))
+
+    def _load(self, kind, book, records, rate_field):
+        changed = set()
+        with self._lock:
+            for key in [key for key in self._legs if key[0] == kind]:
+                self._apply(key, None, None, (), changed)
+            for key, record in records:
+                self._apply((kind, key), book, record.get('accountId'),
+                            self._legs_of(record, rate_field), changed)
+            events = self._crossings(changed)
+        self._notify(events)
+
+    def load(self, positions):
+        '''
+        Replaces the position exposure with that of positions (eg.
+        OpenPosition records from get_model).
+        '''
+        self._load('position', self.exposure,
+                   [(record.get('tradeId'), record) for record in positions],
+                   'open')
+
+    def load_orders(self, orders):
+        '''
+        Replaces the pending exposure with that of orders (eg. Order
+        records from get_model).
+        '''
+        self._load('order', self.pending,
+                   [(record.get('orderId', ''), self._order_record(record))
+                    for record in orders], 'rate')
+
+    def get(self, account_id, currency, pending=False):
+        '''
+        Returns the exposure of account_id to currency, from open
+        positions and, with pending, open orders too.
+        '''
+        amount = self.exposure.get(account_id, {}).get(currency, 0.0)
+        if pending:
+            amount += self.pending.get(account_id, {}).get(currency, 0.0)
+        return amount
+
+    def add_threshold(self, currency, limit, callback, account_id=None):
+        '''
+        Calls callback(account_id, currency, exposure, breached) when the
+        absolute position exposure to currency goes over limit (breached
+        True) and when it is back within limit (breached False).
+
+        :param currency: eg. 'USD'
+        :param limit: absolute exposure, in currency units
+        :param callback: function
+        :param account_id: * Optional * only this account
+        :return: None
+        '''
+        with self._lock:
+            self._thresholds.setdefault(currency, []).append(
+                (account_id, limit, callback))
+            changed = set((True, account, currency)
+                          for account in self.exposure)
+            events = self._crossings(changed)
+        self._notify(events)
+
+    def _crossings(self, changed):
+        events = []
+        for is_position, account_id, currency in changed:
+            thresholds = self._thresholds.get(currency)
+            if not is_position or not thresholds:
+                continue
+            amount = self.exposure.get(account_id, {}).get(currency, 0.0)
+            for threshold in thresholds:
+                only, limit, callback = threshold
+                if only is not None and only != account_id:
+                    continue
+                key = (account_id, id(threshold))
+                breached = abs(amount) > limit
+                if breached != (key in self._breached):
+                    if breached:
+                        self._breached.add(key)
+                    else:
+                        self._breached.discard(key)
+                    events.append((callback, account_id, currency, amount,
+                                   breached))
+        return events
+
+    @staticmethod
+    def _notify(events):
+        for callback, account_id, currency, amount, breached in events:
+            try:
+                callback(account_id, currency, amount, breached)
+            except Exception as e:
+                logging.error("Exposure callback failed: %s" % e)
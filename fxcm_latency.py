@@ -0,0 +1,123 @@
+import logging
+import math
+import threading
+
+
+class LatencyHistogram(object):
+    '''Fixed memory histogram of durations in seconds.
+    Buckets grow by 10% from 1 microsecond to about 100 seconds, so
+    percentiles are within 10% of the true value whatever the count.
+    Durations below 1 microsecond (including negative ones, from clock
+    differences) count in the first bucket.
+    '''
+    LOWEST = 1e-6
+    GROWTH = 1.1
+    BUCKETS = 194
+
+    def __init__(self):
+        self.counts = [0] * self.BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.max = None
+        self._scale = 1 / math.log(self.GROWTH)
+
+    def record(self, seconds):
+        if seconds > self.LOWEST:
+            index = int(math.log(seconds / self.LOWEST) * self._scale) + 1
+            if index >= self.BUCKETS:
+                index = self.BUCKETS - 1
+        else:
+            index = 0
+        self.counts[index] += 1
+        self.count += 1
+        self.total += seconds
+        if self.max is None or seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, p):
+        '''
+        Returns the upper bound of the bucket holding the p-th percentile
+        (0 to 100), or None if nothing was recorded.
+        '''
+        if not self.count:
+            return None
+        rank = max(1, int(math.ceil(self.count * p / 100.0)))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(self.LOWEST * self.GROWTH ** index, self.max)
+        return self.max
+
+    def summary(self):
+        return {'count': self.count,
+                'mean': self.total / self.count if self.count else None,
+                'p50': self.percentile(50),
+                'p99': self.percentile(99),
+                'max': self.max}
+
+
+class LatencyMonitor(object):
+    '''Per symbol latency histograms of the price update path:
+    network - server Updated timestamp to socket receipt
+    queue - socket receipt to handler start (dispatch queues, conflation)
+    handler - handler run time, including decoding
+    '''
+    STAGES = ('network', 'queue', 'handler')
+
+    def __init__(self):
+        self.histograms = {}
+        self._lock = threading.Lock()
+        self._timer = None
+
+    def record(self, symbol, network, queue, handler):
+        histograms = self.histograms.get(symbol)
+        if histograms is None:
+            with self._lock:
+                histograms = self.histograms.setdefault(
+                    symbol, [LatencyHistogram() for stage in self.STAGES])
+        histograms[0].record(network)
+        histograms[1].record(queue)
+        histograms[2].record(handler)
+
+    def snapshot(self):
+        '''
+        Returns {symbol: {stage: {'count', 'mean', 'p50', 'p99', 'max'}}}
+        in seconds.
+        '''
+        with self._lock:
+            histograms = list(self.histograms.items())
+        return dict((symbol, dict(zip(self.STAGES,
+                                      [h.summary() for h in stages])))
+                    for symbol, stages in histograms)
+
+    def reset(self):
+        with self._lock:
+            self.histograms = {}
+
+    def start_logging(self, interval, logger=None):
+        '''
+        Logs one line per symbol every interval seconds, at INFO level.
+        '''
+        self.stop_logging()
+        logger = logger or logging.getLogger(__name__)
+
+        def log():
+            for symbol, stages in sorted(self.snapshot().items()):
+                logger.info("%s latency ms %s" % (symbol, " ".join(
+                    "%s p50=%.3f p99=%.3f max=%.3f" % (
+                        stage, stages[stage]['p50'] * 1e3,
+                        stages[stage]['p99'] * 1e3,
+                        stages[stage]['max'] * 1e3)
+                    for stage in self.STAGES if stages[stage]['count'])))
+            self._timer = threading.Timer(interval, log)
+            self._timer.daemon = True
+            self._timer.start()
+        self._timer = threading.Timer(interval, log)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def stop_logging(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
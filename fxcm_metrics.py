@@ -0,0 +1,145 @@
+import re
+import threading
+
+from fxcm_latency import LatencyHistogram
+
+
+# numeric path segments (offer ids in /candles/1/m1) are folded so
+# that endpoints stay few
+_ID_SEGMENT = re.compile(r'/\d+(?=/|$)')
+
+
+def endpoint_name(command):
+    '''
+    Returns the endpoint command is counted under, eg. /candles/:id/m1
+    for /candles/1/m1.
+    '''
+    return _ID_SEGMENT.sub('/:id', command.split('?', 1)[0])
+
+
+class EndpointStats(object):
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.not_executed = 0
+        self.statuses = {}
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.latency = LatencyHistogram()
+
+
+class RestMetrics(object):
+    '''Per endpoint REST call metrics, recorded by Trader.send:
+    calls, latency, HTTP status codes, responses with executed false,
+    requests that failed without a response, and bytes in and out.
+    '''
+
+    def __init__(self):
+        self.endpoints = {}
+        self._lock = threading.Lock()
+
+    def _stats(self, command):
+        name = endpoint_name(command)
+        stats = self.endpoints.get(name)
+        if stats is None:
+            stats = self.endpoints[name] = EndpointStats()
+        return stats
+
+    def record(self, command, seconds, status, executed=True, bytes_out=0,
+               bytes_in=0):
+        '''
+        Records a call that got a response.
+
+        :param command: request path
+        :param seconds: call duration
+        :param status: HTTP status code
+        :param executed: the response's executed flag
+        :param bytes_out: request size (url and body)
+        :param bytes_in: response body size
+        '''
+        with self._lock:
+            stats = self._stats(command)
+            stats.count += 1
+            stats.statuses[status] = stats.statuses.get(status, 0) + 1
+            if not executed:
+                stats.not_executed += 1
+            stats.bytes_out += bytes_out
+            stats.bytes_in += bytes_in
+            stats.latency.record(seconds)
+
+    def record_error(self, command):
+        '''
+        Records a call that failed without a response (connection errors,
+        timeouts, undecodable responses).
+        '''
+        with self._lock:
+            stats = self._stats(command)
+            stats.count += 1
+            stats.errors += 1
+
+    def snapshot(self):
+        '''
+        Returns {endpoint: {'count', 'errors', 'not_executed', 'statuses',
+        'bytes_in', 'bytes_out', 'latency': {'count', 'mean', 'p50', 'p99',
+        'max'}}}, latency in seconds.
+        '''
+        with self._lock:
+            return dict((name, {'count': stats.count,
+                                'errors': stats.errors,
+                                'not_executed': stats.not_executed,
+                                'statuses': dict(stats.statuses),
+                                'bytes_in': stats.bytes_in,
+                                'bytes_out': stats.bytes_out,
+                                'latency': stats.latency.summary()})
+                        for name, stats in self.endpoints.items())
+
+    def prometheus(self, prefix='fxcm_rest'):
+        '''
+        Returns the metrics in the Prometheus text exposition format.
+        '''
+        snapshot = self.snapshot()
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append("# HELP %s_%s %s" % (prefix, name, help_text))
+            lines.append("# TYPE %s_%s %s" % (prefix, name, kind))
+            for labels, value in samples:
+                lines.append("%s_%s{%s} %s" % (prefix, name, ",".join(
+                    '%s="%s"' % label for label in labels), value))
+
+        endpoints = sorted(snapshot.items())
+        metric("requests_total", "counter", "REST calls by HTTP status",
+               [((("endpoint", name), ("status", status)), count)
+                for name, stats in endpoints
+                for status, count in sorted(stats['statuses'].items())])
+        metric("errors_total", "counter", "REST calls without a response",
+               [((("endpoint", name),), stats['errors'])
+                for name, stats in endpoints])
+        metric("not_executed_total", "counter",
+               "REST responses with executed false",
+               [((("endpoint", name),), stats['not_executed'])
+                for name, stats in endpoints])
+        metric("sent_bytes_total", "counter", "REST request bytes",
+               [((("endpoint", name),), stats['bytes_out'])
+                for name, stats in endpoints])
+        metric("received_bytes_total", "counter", "REST response bytes",
+               [((("endpoint", name),), stats['bytes_in'])
+                for name, stats in endpoints])
+        samples = []
+        for name, stats in endpoints:
+            latency = stats['latency']
+            if not latency['count']:
+                continue
+            for quantile in ('p50', 'p99'):
+                samples.append(((("endpoint", name),
+                                 ("quantile", "0.%s" % quantile[1:])),
+                                latency[quantile]))
+        metric("latency_seconds", "summary", "REST call latency", samples)
+        for name, stats in endpoints:
+            latency = stats['latency']
+            if latency['count']:
+                lines.append('%s_latency_seconds_sum{endpoint="%s"} %s' % (
+                    prefix, name, latency['mean'] * latency['count']))
+                lines.append('%s_latency_seconds_count{endpoint="%s"} %s' %
+                             (prefix, name, latency['count']))
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,163 @@
+from concurrent.futures import Future
+import functools
+import threading
+
+
+class OrderIndex(object):
+    '''Orders seen on the Order socket updates, indexed for O(1) lookups:
+    orders - orderId -> current state of the order, the fields of all
+             its updates merged (action holds the latest one)
+    orderId -> tradeId, tradeId -> orderIds and symbol -> open orderIds,
+    where an order is open from its first update until one with
+    action 'D' (filled, cancelled or expired).
+
+    accepted() and filled() return futures resolved by those updates, so
+    callers can block or await instead of polling.
+    '''
+
+    def __init__(self):
+        self.orders = {}
+        self._trade_of = {}
+        self._orders_of = {}
+        self._open = {}
+        # orderId -> futures waiting for the order to appear / get a trade
+        self._accepted = {}
+        self._filled = {}
+        self._lock = threading.Lock()
+
+    def update(self, message):
+        '''
+        Applies an Order update.
+
+        :param message: decoded Order update
+        :return: the order's state record
+        '''
+        order_id = message.get('orderId', '')
+        resolved = []
+        with self._lock:
+            record = self.orders.get(order_id)
+            if record is None:
+                record = self.orders[order_id] = {}
+            record.update(message)
+            trade_id = message.get('tradeId')
+            if trade_id and self._trade_of.get(order_id) != trade_id:
+                self._trade_of[order_id] = trade_id
+                self._orders_of.setdefault(trade_id, []).append(order_id)
+            symbol = record.get('currency')
+            if symbol is not None:
+                open_orders = self._open.get(symbol)
+                if open_orders is None:
+                    open_orders = self._open[symbol] = set()
+                if message.get('action') == 'D':
+                    open_orders.discard(order_id)
+                else:
+                    open_orders.add(order_id)
+            for future in self._accepted.pop(order_id, ()):
+                resolved.append((future, record))
+            trade_id = self._trade_of.get(order_id)
+            if trade_id is not None or message.get('action') == 'D':
+                for future in self._filled.pop(order_id, ()):
+                    resolved.append((future, trade_id))
+        for future, result in resolved:
+            # futures given up on (cancelled, eg. on a timeout) are skipped
+            if future.set_running_or_notify_cancel():
+                future.set_result(result)
+        return record
+
+    def _waiting(self, waiting, order_id, future):
+        # called once future is done: drops it if it was cancelled
+        # before the order's update arrived
+        if not future.cancelled():
+            return
+        with self._lock:
+            futures = waiting.get(order_id)
+            if futures is not None and future in futures:
+                futures.remove(future)
+                if not futures:
+                    del waiting[order_id]
+
+    def accepted(self, order_id):
+        '''
+        Returns a Future resolved with the order's state record once an
+        update for order_id has arrived (at once if one already has).
+        '''
+        order_id = str(order_id)
+        future = Future()
+        with self._lock:
+            record = self.orders.get(order_id)
+            if record is None:
+                self._accepted.setdefault(order_id, []).append(future)
+        if record is None:
+            future.add_done_callback(functools.partial(
+                self._waiting, self._accepted, order_id))
+        else:
+            future.set_result(record)
+        return future
+
+    def filled(self, order_id):
+        '''
+        Returns a Future resolved with the tradeId order_id opened or
+        closed once an update links them, or with None if the order is
+        deleted without a trade (cancelled, rejected, expired).
+        '''
+        order_id = str(order_id)
+        future = Future()
+        with self._lock:
+            trade_id = self._trade_of.get(order_id)
+            record = self.orders.get(order_id)
+            pending = trade_id is None and (record is None or
+                                            record.get('action') != 'D')
+            if pending:
+                self._filled.setdefault(order_id, []).append(future)
+        if pending:
+            future.add_done_callback(functools.partial(
+                self._waiting, self._filled, order_id))
+        else:
+            future.set_result(trade_id)
+        return future
+
+    def get(self, order_id):
+        '''
+        Returns the state record of order_id, or None.
+        '''
+        return self.orders.get(str(order_id))
+
+    def trade_id(self, order_id):
+        '''
+        Returns the tradeId order_id opened or closed, or None.
+        '''
+        return self._trade_of.get(str(order_id))
+
+    def order_ids(self, trade_id):
+        '''
+        Returns the orderIds linked to trade_id, oldest first.
+        '''
+        with self._lock:
+            return list(self._orders_of.get(str(trade_id), ()))
+
+    def open_orders(self, symbol=None):
+        '''
+        Returns the orderIds of the open orders for symbol, or of all
+        symbols.
+        '''
+        with self._lock:
+            if symbol is not None:
+                return set(self._open.get(symbol, ()))
+            return set().union(*self._open.values())
+
+    def load(self, orders):
+        '''
+        Replaces the indexed orders with orders (eg. the orders of
+        get_model), resolving the futures they satisfy. Futures still
+        waiting are kept.
+        '''
+        self.clear()
+        for order in orders:
+            self.update(order)
+
+    def clear(self):
+        with self._lock:
+            self.orders.clear()
+            self._trade_of.clear()
+            self._orders_of.clear()
+            self._open.clear()
@@ -0,0 +1,219 @@
+import threading
+
+import numpy as np
+
+
+class PnlEngine(object):
+    '''Floating P&L of open positions, kept in NumPy column arrays (symbol,
+    account, side, amount, open rate, value per pip, P&L) with one row
+    per trade. A price update recomputes only the rows of its symbol, in
+    one vectorized step, and moves the per account totals by the change.
+
+    Buys are marked at the bid and sells at the ask. Pips use the
+    symbol's pip size from symbol_info ('pip', else one unit of the
+    second to last decimal of ratePrecision). P&L is pips times pipCost
+    per 1K when symbol_info has pipCost (the account currency), else it
+    is in the quote currency.
+    '''
+
+    def __init__(self, symbol_info, capacity=256):
+        '''
+        :param symbol_info: Dict of symbol: offer, eg. Trader.symbol_info
+        :param capacity: initial rows
+        '''
+        self.symbol_info = symbol_info
+        self.trade_ids = []
+        self._row = {}
+        self._symbols = {}
+        self._accounts = {}
+        self._marks = {}
+        self._rows = {}
+        self._lock = threading.Lock()
+        self._symbol = np.zeros(capacity, np.int32)
+        self._account = np.zeros(capacity, np.int32)
+        self._side = np.zeros(capacity)
+        self._amount = np.zeros(capacity)
+        self._open = np.zeros(capacity)
+        self._pip = np.ones(capacity)
+        self._pip_value = np.zeros(capacity)
+        self.pl = np.zeros(capacity)
+        self.account_pl = np.zeros(8)
+
+    def __len__(self):
+        return len(self.trade_ids)
+
+    def _index(self, names, name):
+        index = names.get(name)
+        if index is None:
+            index = names[name] = len(names)
+        return index
+
+    def _grow(self):
+        for name in ('_symbol', '_account', '_side', '_amount', '_open',
+                     '_pip', '_pip_value', 'pl'):
+            column = getattr(self, name)
+            grown = np.zeros(2 * len(column), column.dtype)
+            grown[:len(column)] = column
+            setattr(self, name, grown)
+
+    def _pip_size(self, symbol):
+        info = self.symbol_info.get(symbol) or {}
+        if info.get('pip'):
+            return float(info['pip'])
+        return 10.0 ** (1 - int(info.get('ratePrecision', 5)))
+
+    def _symbol_rows(self, symbol_index):
+        # the rows of a symbol with their constants gathered into
+        # contiguous arrays, rebuilt only when its positions change
+        cached = self._rows.get(symbol_index)
+        if cached is None:
+            rows = np.flatnonzero(
+                self._symbol[:len(self.trade_ids)] == symbol_index)
+            cached = self._rows[symbol_index] = (
+                rows, self._side[rows] > 0, self._open[rows],
+                self._side[rows] * self._pip_value[rows] / self._pip[rows],
+                self._account[rows])
+        return cached
+
+    def set(self, trade_id, position):
+        '''
+        Adds or updates the row of trade_id from an OpenPosition record
+        (currency, accountId, isBuy, amountK, open), or removes it when
+        position is None.
+        '''
+        if position is None:
+            return self.remove(trade_id)
+        if position.get('amountK') is None or position.get('open') is None:
+            return
+        with self._lock:
+            symbol = position.get('currency')
+            symbol_index = self._index(self._symbols, symbol)
+            account_index = self._index(self._accounts,
+                                        position.get('accountId'))
+            side = 1.0 if position.get('isBuy') else -1.0
+            amount = float(position['amountK'])
+            rate = float(position['open'])
+            row = self._row.get(trade_id)
+            if row is not None and self._symbol[row] == symbol_index and \
+                    self._account[row] == account_index and \
+                    self._side[row] == side and \
+                    self._amount[row] == amount and self._open[row] == rate:
+                # P&L only updates (grossPL, close, ...) change nothing here
+                return
+            if account_index >= len(self.account_pl):
+                grown = np.zeros(2 * len(self.account_pl))
+                grown[:len(self.account_pl)] = self.account_pl
+                self.account_pl = grown
+            if row is None:
+                row = len(self.trade_ids)
+                if row == len(self._side):
+                    self._grow()
+                self.trade_ids.append(trade_id)
+                self._row[trade_id] = row
+            else:
+                self.account_pl[self._account[row]] -= self.pl[row]
+                self._rows.pop(int(self._symbol[row]), None)
+            self.pl[row] = 0.0
+            self._rows.pop(symbol_index, None)
+            info = self.symbol_info.get(symbol) or {}
+            pip = self._pip_size(symbol)
+            self._symbol[row] = symbol_index
+            self._account[row] = account_index
+            self._side[row] = side
+            self._amount[row] = amount
+            self._open[row] = rate
+            self._pip[row] = pip
+            if info.get('pipCost'):
+                self._pip_value[row] = float(info['pipCost']) * amount
+            else:
+                self._pip_value[row] = pip * amount * 1000
+            mark = self._marks.get(symbol)
+            if mark is not None:
+                self._mark(self._symbol_rows(symbol_index), *mark)
+
+    def remove(self, trade_id):
+        '''
+        Removes the row of trade_id; the last row takes its place.
+        '''
+        with self._lock:
+            row = self._row.pop(trade_id, None)
+            if row is None:
+                return
+            self.account_pl[self._account[row]] -= self.pl[row]
+            self._rows.pop(int(self._symbol[row]), None)
+            last = len(self.trade_ids) - 1
+            if row != last:
+                moved = self.trade_ids[last]
+                self.trade_ids[row] = moved
+                self._row[moved] = row
+                for column in (self._symbol, self._account, self._side,
+                               self._amount, self._open, self._pip,
+                               self._pip_value, self.pl):
+                    column[row] = column[last]
+                self._rows.pop(int(self._symbol[row]), None)
+            self.trade_ids.pop()
+
+    def load(self, positions):
+        '''
+        Replaces all rows with positions (OpenPosition records).
+        '''
+        with self._lock:
+            self.trade_ids = []
+            self._row = {}
+            self._rows = {}
+            self.account_pl[:] = 0.0
+        for position in positions:
+            self.set(position.get('tradeId'), position)
+
+    def _mark(self, cached, bid, ask):
+        rows, buy, rate, pl_per_move, account = cached
+        pl = (np.where(buy, bid, ask) - rate) * pl_per_move
+        change = pl - self.pl[rows]
+        self.pl[rows] = pl
+        self.account_pl += np.bincount(account, weights=change,
+                                       minlength=len(self.account_pl))
+
+    def mark(self, symbol, bid, ask):
+        '''
+        Revalues the positions in symbol at bid / ask.
+        '''
+        self._marks[symbol] = (bid, ask)
+        symbol_index = self._symbols.get(symbol)
+        if symbol_index is None:
+            return
+        with self._lock:
+            cached = self._symbol_rows(symbol_index)
+            if len(cached[0]):
+                self._mark(cached, bid, ask)
+
+    def accounts(self):
+        '''
+        Returns {accountId: floating P&L}.
+        '''
+        with self._lock:
+            return dict((account, float(self.account_pl[index]))
+                        for account, index in self._accounts.items())
+
+    def symbols(self):
+        '''
+        Returns {symbol: floating P&L}.
+        '''
+        with self._lock:
+            count = len(self.trade_ids)
+            totals = np.bincount(self._symbol[:count],
+                                 weights=self.pl[:count],
+                                 minlength=len(self._symbols))
+            return dict((symbol, float(totals[index]))
+                        for symbol, index in self._symbols.items())
+
+    def trade(self, trade_id):
+        '''
+        Returns {'pips', 'pl'} of trade_id, or None.
+        '''
+        with self._lock:
+            row = self._row.get(trade_id)
+            if row is None:
+                return None
+            pl = float(self.pl[row])
+            pip_value = float(self._pip_value[row])
+            return {'pips': pl / pip_value if pip_value else 0.0, 'pl': pl}
@@ -0,0 +1,177 @@
+import threading
+
+
+class _Aggregate(object):
+    __slots__ = ('count', 'buy_amount', 'sell_amount', 'buy_value',
+                 'sell_value', 'closed_count', 'realized_pl')
+
+    def __init__(self):
+        self.count = 0
+        self.buy_amount = 0.0
+        self.sell_amount = 0.0
+        self.buy_value = 0.0
+        self.sell_value = 0.0
+        self.closed_count = 0
+        self.realized_pl = 0.0
+
+    def add(self, is_buy, amount, rate, sign):
+        self.count += sign
+        if is_buy:
+            self.buy_amount += sign * amount
+            self.buy_value += sign * amount * rate
+        else:
+            self.sell_amount += sign * amount
+            self.sell_value += sign * amount * rate
+        if not self.count:
+            # no rounding residue once the last position is gone
+            self.buy_amount = self.sell_amount = 0.0
+            self.buy_value = self.sell_value = 0.0
+
+    def snapshot(self):
+        average_buy = self.buy_value / self.buy_amount \
+            if self.buy_amount else None
+        average_sell = self.sell_value / self.sell_amount \
+            if self.sell_amount else None
+        net = self.buy_amount - self.sell_amount
+        return {'count': self.count,
+                'net_amountK': net,
+                'buy_amountK': self.buy_amount,
+                'sell_amountK': self.sell_amount,
+                'average_buy': average_buy,
+                'average_sell': average_sell,
+                'average_open': average_buy if net > 0 else
+                average_sell if net < 0 else None,
+                'closed_count': self.closed_count,
+                'realized_pl': self.realized_pl}
+
+
+class PositionBook(object):
+    '''Open positions kept current from OpenPosition and ClosedPosition
+    socket updates, with running aggregates per symbol and per account
+    and symbol, each updated in O(1) per update:
+    count, net_amountK (buys less sells), buy/sell amountK, average_buy,
+    average_sell and average_open (the average of the net side), plus
+    closed_count and realized_pl (sum of grossPL) of closed positions.
+    '''
+
+    def __init__(self):
+        # tradeId -> merged OpenPosition record
+        self.trades = {}
+        self._symbols = {}
+        self._accounts = {}
+        self._lock = threading.Lock()
+
+    def _aggregates(self, record):
+        symbol = record.get('currency')
+        account_id = record.get('accountId')
+        by_symbol = self._symbols.get(symbol)
+        if by_symbol is None:
+            by_symbol = self._symbols[symbol] = _Aggregate()
+        by_account = self._accounts.get((account_id, symbol))
+        if by_account is None:
+            by_account = self._accounts[(account_id, symbol)] = _Aggregate()
+        return by_symbol, by_account
+
+    def _count(self, record, sign):
+        if record.get('amountK') is None or record.get('open') is None:
+            return
+        is_buy = record.get('isBuy')
+        amount = float(record['amountK'])
+        rate = float(record['open'])
+        for aggregate in self._aggregates(record):
+            aggregate.add(is_buy, amount, rate, sign)
+
+    def update(self, message):
+        '''
+        Applies an OpenPosition update.
+
+        :param message: decoded OpenPosition update
+        :return: the trade's merged record, None once deleted
+        '''
+        trade_id = message.get('tradeId')
+        if trade_id is None:
+            return
+        with self._lock:
+            record = self.trades.get(trade_id)
+            if record is not None:
+                self._count(record, -1)
+            if message.get('action') == 'D':
+                self.trades.pop(trade_id, None)
+                return None
+            record = dict(record or {})
+            record.update(message)
+            record.pop('action', None)
+            self.trades[trade_id] = record
+            self._count(record, 1)
+            return record
+
+    def close(self, message):
+        '''
+        Applies a ClosedPosition update: the trade leaves the book (if
+        its OpenPosition delete has not yet arrived) and its grossPL is
+        added to the realized figures.
+
+        :param message: decoded ClosedPosition update
+        :return: None
+        '''
+        trade_id = message.get('tradeId')
+        if trade_id is None or message.get('action') not in (None, 'I'):
+            return
+        with self._lock:
+            record = self.trades.pop(trade_id, None)
+            if record is not None:
+                self._count(record, -1)
+            closed = dict(record or {})
+            closed.update(message)
+            if closed.get('currency') is None:
+                return
+            for aggregate in self._aggregates(closed):
+                aggregate.closed_count += 1
+                aggregate.realized_pl += float(closed.get('grossPL') or 0)
+
+    def load(self, positions):
+        '''
+        Replaces the open positions with positions (eg. the
+        open_positions of get_model), keeping the closed figures.
+        '''
+        with self._lock:
+            for record in self.trades.values():
+                self._count(record, -1)
+            self.trades = {}
+            for position in positions:
+                record = dict(position)
+                record.pop('action', None)
+                self.trades[record.get('tradeId')] = record
+                self._count(record, 1)
+
+    def symbol(self, symbol, account_id=None):
+        '''
+        Returns the aggregates of symbol, over all accounts or for
+        account_id.
+        '''
+        with self._lock:
+            if account_id is None:
+                aggregate = self._symbols.get(symbol)
+            else:
+                aggregate = self._accounts.get((account_id, symbol))
+            return (aggregate or _Aggregate()).snapshot()
+
+    def account(self, account_id):
+        '''
+        Returns {symbol: aggregates} for account_id.
+        '''
+        with self._lock:
+            return dict((symbol, aggregate.snapshot())
+                        for (account, symbol), aggregate
+                        in self._accounts.items()
+                        if account == account_id and
+                        (aggregate.count or aggregate.closed_count))
+
+    def symbols(self):
+        '''
+        Returns {symbol: aggregates} over all accounts.
+        '''
+        with self._lock:
+            return dict((symbol, aggregate.snapshot())
+                        for symbol, aggregate in self._symbols.items()
+                        if aggregate.count or aggregate.closed_count)
@@ -0,0 +1,110 @@
+import mmap
+import struct
+import threading
+import time
+
+
+MAGIC = b'FXCMREC1'
+# receipt time, event name length, payload length
+RECORD = struct.Struct('<dHI')
+
+
+class TickRecorder(object):
+    '''Appends socket messages (price and model updates) to a binary file,
+    each with the time it was received, for replay with TickReplayer.
+    The file is a header followed by records of
+    receipt time (float64), event length (uint16), payload length (uint32),
+    event name and payload, all little endian. Recording to an existing
+    file appends to it.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+        self._lock = threading.Lock()
+        self._file = open(path, 'ab')
+        if self._file.tell() == 0:
+            self._file.write(MAGIC)
+
+    def write(self, event, payload, received=None):
+        '''
+        Appends one message.
+
+        :param event: socket event (symbol or model name)
+        :param payload: message as received, str or bytes
+        :param received: * Optional * receipt time, defaults to now
+        :return: None
+        '''
+        if received is None:
+            received = time.time()
+        if not isinstance(payload, bytes):
+            payload = payload.encode('utf-8')
+        name = event.encode('utf-8')
+        with self._lock:
+            self._file.write(RECORD.pack(received, len(name), len(payload)))
+            self._file.write(name)
+            self._file.write(payload)
+            self.count += 1
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class TickReplayer(object):
+    '''Reads a file written by TickRecorder through a memory map and plays
+    the messages back to handlers, keeping their original spacing scaled
+    by speed.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:len(MAGIC)] != MAGIC:
+            self._map.close()
+            raise ValueError("%s is not a tick recording" % path)
+
+    def __iter__(self):
+        '''
+        Yields (received, event, payload) for each message, payload as
+        the str the socket delivered.
+        '''
+        data = self._map
+        end = len(data)
+        offset = len(MAGIC)
+        unpack = RECORD.unpack_from
+        size = RECORD.size
+        while offset + size <= end:
+            received, name_length, payload_length = unpack(data, offset)
+            offset += size
+            event = data[offset:offset + name_length].decode('utf-8')
+            offset += name_length
+            payload = data[offset:offset + payload_length].decode('utf-8')
+            offset += payload_length
+            yield received, event, payload
+
+    def replay(self, handler, speed=None):
+        '''
+        Plays the recording back.
+
+        :param handler: function called with (event, payload)
+        :param speed: * Optional * 1 for real time, N for N times faster,
+                      None or 0 for as fast as possible
+        :return: number of messages played
+        '''
+        count = 0
+        start = None
+        for received, event, payload in self:
+            if speed:
+                if start is None:
+                    start = (received, time.time())
+                wait = start[1] + (received - start[0]) / speed - time.time()
+                if wait > 0:
+                    time.sleep(wait)
+            handler(event, payload)
+            count += 1
+        return count
+
+    def close(self):
+        self._map.close()
@@ -1,14 +1,61 @@
 from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
+import functools
 import requests
+from requests.adapters import HTTPAdapter
 from socketIO_client import SocketIO
 import logging
+import logging.handlers
 import json
+import queue
+import re
 import uuid
 import threading
 from dateutil.parser import parse
+from dateutil import tz as dateutil_tz
 from datetime import datetime
 import time
 import types
+from fxcm_bars import BarAggregator
+from fxcm_dispatch import Conflator, Dispatcher, ShardedDispatcher
+from fxcm_exposure import ExposureTracker
+from fxcm_latency import LatencyMonitor
+from fxcm_metrics import RestMetrics
+from fxcm_order_index import OrderIndex
+from fxcm_positions import PositionBook
+from fxcm_recorder import TickRecorder, TickReplayer
+try:
+    import numpy as np
+    from fxcm_candle_store import CandleStore
+    from fxcm_pnl import PnlEngine
+    from fxcm_tick_buffer import TickBuffer
+except ImportError:
+    np = None
+    CandleStore = None
+    PnlEngine = None
+    TickBuffer = None
+
+
+# decoder for socket payloads: orjson when installed, else the stdlib.
+# Can be replaced per instance through Trader.decode
+try:
+    import orjson
+    DECODER = orjson.loads
+except ImportError:
+    DECODER = json.loads
+
+CANDLE_HEADERS = ['timestamp', 'bidopen', 'bidclose', 'bidhigh', 'bidlow',
+                  'askopen', 'askclose', 'askhigh', 'asklow', 'tickqty']
+
+
+def takes_decoded(handler):
+    '''
+    Marks a socket handler as taking the decoded message rather than the
+    raw payload. Trader decodes each payload once, before calling it.
+    '''
+    handler.decoded = True
+    return handler
 
 
 def isInt(v):
@@ -21,9 +68,183 @@ def timestamp_to_string(timestamp, datetime_fmt="%Y/%m/%d %H:%M:%S:%f"):
     return datetime.fromtimestamp(timestamp).strftime(datetime_fmt)
 
 
+def to_timestamp(value):
+    '''
+    Returns value (a timestamp or a date/time string) as a timestamp
+    '''
+    if not isInt(value):
+        return int(time.mktime(parse(value).timetuple()))
+    return int(float(value))
+
+
+_TIME_DIRECTIVES = 'HIMSpf'
+_DAY_DIRECTIVES = 'aAbBCdegGhjmuUVwWxyYzZ%'
+_FORMAT_TOKEN = re.compile(r'%.|[^%]', re.S)
+# time of day formats -> {whole seconds into the day: formatted time of
+# day}, so at most a day's worth of entries for each of at most
+# _CLOCK_FORMATS formats
+_CLOCKS = {}
+_CLOCK_FORMATS = 16
+
+
+def _split_format(dt_fmt):
+    '''
+    Splits dt_fmt into a per day format, with \x01 where each time of day
+    part goes, and the formats of those parts. Returns None if dt_fmt
+    holds a directive that is neither.
+    '''
+    tokens = _FORMAT_TOKEN.findall(dt_fmt)
+    if ''.join(tokens) != dt_fmt:
+        return None
+    day_fmt, time_fmts = '', []
+    clock = literals = None
+    for token in tokens + ['%%']:
+        directive = token[1] if token[0] == '%' else None
+        if directive is not None and directive in _TIME_DIRECTIVES:
+            # literals between two time directives join the time part
+            clock = token if clock is None else clock + literals + token
+            literals = ''
+        elif directive is None and clock is not None:
+            literals += token
+        elif directive is not None and directive not in _DAY_DIRECTIVES:
+            return None
+        else:
+            if clock is not None:
+                time_fmts.append(clock)
+                day_fmt += '\x01' + literals
+                clock = None
+            day_fmt += token
+    return day_fmt[:-2], time_fmts
+
+
+def format_timestamps(timestamps, dt_fmt, tz=None):
+    '''
+    Formats a column of timestamps with dt_fmt, the same as calling
+    datetime.fromtimestamp(t, tz).strftime(dt_fmt) for each one.
+    The date part is formatted once per day and the time of day parts
+    once per distinct time of day (kept between calls for whole
+    seconds, within the call for fractions), so long candle
+    columns cost little more than a string substitution per row.
+
+    :param timestamps: iterable of timestamps
+    :param dt_fmt: strftime format
+    :param tz: * Optional * tzinfo or zone name (eg. "UTC",
+               "America/New_York"). Defaults to the host's local zone
+    :return: list of strings
+    '''
+    if tz is None:
+        tz = dateutil_tz.tzlocal()
+    elif not hasattr(tz, 'utcoffset'):
+        tz = dateutil_tz.gettz(tz)
+    split = _split_format(dt_fmt)
+    if split is None:
+        return [datetime.fromtimestamp(t, tz).strftime(dt_fmt)
+                for t in timestamps]
+    day_fmt, time_fmts = split
+    clocks = _CLOCKS.get(tuple(time_fmts))
+    if clocks is None:
+        if len(_CLOCKS) >= _CLOCK_FORMATS:
+            _CLOCKS.clear()
+        clocks = _CLOCKS[tuple(time_fmts)] = {}
+    fractions = {}
+    start = end = 0
+    datestrings = []
+    append = datestrings.append
+    for t in timestamps:
+        if not start <= t < end:
+            moment = datetime.fromtimestamp(t, tz)
+            offset = moment.utcoffset()
+            start = t - (t + offset.total_seconds()) % 86400
+            end = start + 86400
+            # the zone offset changes within the day: recheck every 15 min
+            if datetime.fromtimestamp(end - 1, tz).utcoffset() != offset:
+                end = (t // 900 + 1) * 900
+            prefix = moment.strftime(day_fmt).replace(
+                '%', '%%').replace('\x01', '%s')
+        clock = t - start
+        cache = clocks if clock % 1 == 0 else fractions
+        values = cache.get(clock)
+        if values is None:
+            moment = datetime(2000, 1, 1, int(clock // 3600),
+                              int(clock % 3600 // 60), int(clock % 60),
+                              int(round(clock % 1 * 1e6)))
+            values = cache[clock] = tuple(moment.strftime(fmt)
+                                          for fmt in time_fmts)
+        append(prefix % values)
+    return datestrings
+
+
+def _candle_matrix(candles):
+    if np is None:
+        raise ImportError("NumPy is required for as_array")
+    # one pass over the rows straight into a float64 buffer
+    width = len(CANDLE_HEADERS)
+    return np.fromiter(chain.from_iterable(candles), dtype=np.float64,
+                       count=len(candles) * width).reshape(-1, width)
+
+
+def _datestrings(timestamps, dt_fmt, tz=None):
+    return np.array(format_timestamps(timestamps.tolist(), dt_fmt, tz),
+                    dtype=str)
+
+
+def candles_to_array(candles, dt_fmt=None, tz=None):
+    '''
+    Converts candles as returned by get_candles into a NumPy structured
+    array with one field per CANDLE_HEADERS entry (int64 timestamp and
+    tickqty, float64 prices), plus datestring if dt_fmt is given
+    (formatted in zone tz, default local).
+    '''
+    matrix = _candle_matrix(candles)
+    dtype = [(name, np.float64) for name in CANDLE_HEADERS]
+    dtype[0] = ('timestamp', np.int64)
+    dtype[-1] = ('tickqty', np.int64)
+    datestrings = None
+    if dt_fmt is not None:
+        datestrings = _datestrings(matrix[:, 0].astype(np.int64), dt_fmt,
+                                   tz)
+        dtype.append(('datestring', datestrings.dtype))
+    array = np.empty(len(matrix), dtype=dtype)
+    for i, name in enumerate(CANDLE_HEADERS):
+        array[name] = matrix[:, i]
+    if datestrings is not None:
+        array['datestring'] = datestrings
+    return array
+
+
+def candles_to_columns(candles, dt_fmt=None, tz=None):
+    '''
+    Converts candles as returned by get_candles into a dict of contiguous
+    NumPy column arrays keyed by the CANDLE_HEADERS names (int64
+    timestamp and tickqty, float64 prices), plus datestring if dt_fmt
+    is given (formatted in zone tz, default local).
+    '''
+    matrix = np.ascontiguousarray(_candle_matrix(candles).T)
+    columns = dict(zip(CANDLE_HEADERS, matrix))
+    columns['timestamp'] = columns['timestamp'].astype(np.int64)
+    columns['tickqty'] = columns['tickqty'].astype(np.int64)
+    if dt_fmt is not None:
+        columns['datestring'] = _datestrings(columns['timestamp'], dt_fmt,
+                                             tz)
+    return columns
+
+
+class _RecordQueueHandler(logging.handlers.QueueHandler):
+    '''
+    Queues records as they are, leaving the %-formatting of message and
+    args to the handlers behind the QueueListener.
+    '''
+
+    def prepare(self, record):
+        return record
+
+
 class PriceUpdate(object):
+    __slots__ = ('bid', 'ask', 'high', 'low', 'updated', 'output_fmt',
+                 'parent', 'symbol_info', 'offer_id', 'symbol')
+
     def __init__(self, bid=None, ask=None, high=None, low=None, updated=None,
-                 symbol_info=None, parent=None):
+                 symbol_info=None, parent=None, symbol=None):
         self.bid = bid
         self.ask = ask
         self.high = high
@@ -31,8 +252,10 @@ class PriceUpdate(object):
         self.updated = updated
         self.output_fmt = "%r"
         self.parent = parent
+        self.symbol_info = symbol_info
+        self.offer_id = None
+        self.symbol = symbol
         if symbol_info is not None:
-            self.symbol_info = symbol_info
             self.offer_id = symbol_info['offerId']
             self.symbol = symbol_info['currency']
             precision = symbol_info['ratePrecision'] / 10.0
@@ -73,21 +296,88 @@ class Trader(object):
                  purpose='General', config_file="fxcm_rest.json"):
         self.config_file = config_file
         self.initialize()
+        self._session_init()
+        # per endpoint call counts, latency, status codes and sizes
+        self.rest_metrics = RestMetrics()
+        self.candle_store = None
+        if self.CONFIG.get('candle_cache'):
+            if CandleStore is None:
+                raise ImportError("NumPy is required for candle_cache")
+            self.candle_store = CandleStore(self.CONFIG['candle_cache'])
         self.socketIO = None
+        # QueueListener writing log records, when log_async is set
+        self.log_listener = None
+        # event -> handler as registered with the socket, see _on
+        self.socket_handlers = {}
+        # event -> (handler, decoded, queued) as passed to _on
+        self.handlers = {}
+        # TickRecorder while recording, see record
+        self.recorder = None
+        # price update latency histograms, when latency is enabled
+        self.latency = None
+        latency = self.CONFIG.get('latency', {})
+        if latency.get('enabled'):
+            self.latency = LatencyMonitor()
         self.updates = {}
         self.symbols = {}
+        # per symbol TickBuffer of recent price updates, when
+        # tick_history_depth is set
+        self.tick_history = {}
+        self.tick_history_depth = self.CONFIG.get('tick_history_depth', 0)
+        # symbol -> {period: BarAggregator} of live bars, see build_bars
+        self.bar_aggregators = {}
         self.symbol_info = {}
         self.symbol_id = {}
         self.account_id = None
         self.account_list = []
         self.accounts = {}
-        self.orders_list = {}
+        # orders from Order updates, indexed by orderId, tradeId and
+        # symbol; orders_list holds each order's current state
+        self.order_index = OrderIndex()
+        self.orders_list = self.order_index.orders
+        # open positions and per symbol / account aggregates from
+        # OpenPosition and ClosedPosition updates
+        self.position_book = PositionBook()
+        # floating P&L of the open positions, revalued on each price
+        # update (needs numpy)
+        self.pnl = None
+        if PnlEngine is not None:
+            self.pnl = PnlEngine(self.symbol_info)
         self.trades = {}
         self.subscriptions = {}
+        # symbol -> Conflator of subscriptions made with conflate
+        self.conflators = {}
+        # runs socket handlers off the socket thread, when dispatch
+        # workers or shards are configured
+        self.dispatcher = None
+        dispatch = self.CONFIG.get('dispatch', {})
+        if dispatch.get('shards'):
+            self.dispatcher = ShardedDispatcher(
+                dispatch['shards'], dispatch.get('maxsize', 1000))
+        elif dispatch.get('workers'):
+            self.dispatcher = Dispatcher(
+                dispatch['workers'], dispatch.get('maxsize', 1000),
+                dispatch.get('policy', 'block'), dispatch.get('policies'))
         self.open_list = []
         self.closed_list = []
-        self.currency_exposure = {}
+        # {accountId: {currency: amount}} of the open positions, kept
+        # current from position updates; open orders in exposure.pending
+        self.exposure = ExposureTracker(self.symbol_info)
+        self.currency_exposure = self.exposure.exposure
+        # local copies of subscribed models, kept current by socket updates
+        self.models = {}
+        self._models_live = set()
+        self._models_pending = {}
+        self._models_lock = threading.Lock()
+        # set once on_connect has loaded accounts and offers and
+        # subscribed, and once the offers are loaded
+        self.ready = threading.Event()
+        self.offers_loaded = threading.Event()
         self.access_token = access_token
+        self.decode = DECODER
+        # builds the socket.io client in login, called as SocketIO is.
+        # Can be replaced per instance, eg. with a stand-in for tests
+        self.socket_factory = SocketIO
         self.env = environment
         self.purpose = purpose
 
@@ -125,10 +415,14 @@ class Trader(object):
         #                         params={'access_token':
         #                                 self.access_token})
         self._log_init()        
-        self.socketIO = SocketIO(self.environment.get("trading"),
-                                 self.environment.get("port"),
-                                 params={'access_token':
-                                         self.access_token})
+        if self.latency is not None and \
+                self.CONFIG['latency'].get('log_interval'):
+            self.latency.start_logging(self.CONFIG['latency']['log_interval'],
+                                       self.logger)
+        self.socketIO = self.socket_factory(self.environment.get("trading"),
+                                            self.environment.get("port"),
+                                            params={'access_token':
+                                                    self.access_token})
         self.socketIO.on('connect', self.on_connect)
         self.socketIO.on('disconnect', self.on_disconnect)
         thread_name = self.access_token + self.env + self.purpose
@@ -156,10 +450,15 @@ class Trader(object):
 
         :return: None
         '''
-        self.logger.info('Websocket connected: ' +
+        self.logger.info('Websocket connected: %s',
                          self.socketIO._engineIO_session.id)
+        self.ready.clear()
+        self.offers_loaded.clear()
         self.bearer = self.bearerGen()
         self.HEADERS['Authorization'] = self.bearer
+        with self._models_lock:
+            self.models.clear()
+            self._models_live.clear()
         accounts = self.get_model("Account").get('accounts', {})
         self.account_list = [a['accountId'] for a in accounts]
         self.account_id = None
@@ -170,21 +469,62 @@ class Trader(object):
                 self.account_id = account_id
 
         self.get_offers()
+        self.offers_loaded.set()
         for item in self.list:
             handler = self.update_handlers.get(item, None)
             if handler is None:
                 self.subscribe(item)
             else:
                 self.subscribe(item, handler)
+        if "Order" in self._models_live:
+            # served from the model store, which is live by now
+            self.order_index.load(self.get_model("Order").get('orders', []))
+        else:
+            self.order_index.clear()
+        self.exposure.load_orders([
+            order for order in list(self.order_index.orders.values())
+            if order.get('action') != 'D'])
+        if "OpenPosition" in self._models_live:
+            # served from the model store, which is live by now
+            self.position_book.load(self.get_model("OpenPosition").get(
+                'open_positions', []))
+            self.exposure.load(self.position_book.trades.values())
+            if self.pnl is not None:
+                self.pnl.load(self.position_book.trades.values())
+        self.ready.set()
+
+    def wait_ready(self, timeout=None):
+        '''
+        Blocks until the connection is ready for trading: accounts and
+        offers loaded and model subscriptions made (see on_connect).
 
-    def Print(self, message, message_type=None, level='INFO'):
-        loggers = dict(INFO=self.logger.info,
-                       DEBUG=self.logger.debug,
-                       WARNING=self.logger.warning,
-                       ERROR=self.logger.error,
-                       CRITICAL=self.logger.critical)
-        if message_type is None or message_type not in self.ignore_output:
-            loggers[level](message)
+        :param timeout: * Optional * seconds
+        :return: True if ready, False on timeout
+        '''
+        return self.ready.wait(timeout)
+
+    def wait_offers(self, timeout=None):
+        '''
+        Blocks until the offers (symbols and symbol_info) are loaded.
+
+        :param timeout: * Optional * seconds
+        :return: True if loaded, False on timeout
+        '''
+        return self.offers_loaded.wait(timeout)
+
+    def Print(self, message, message_type=None, level='INFO', *args):
+        '''
+        Logs message at level unless message_type is in ignore_output.
+        Any args are %-formatted into message by the logger, and only if
+        the level is enabled, so suppressed calls cost a level check.
+        message_type is attached to the record as record.message_type
+        for structured formatters and filters.
+        '''
+        if not self.log_enabled.get(level) or \
+                message_type in self.ignore_output:
+            return
+        self.logger.log(self.LOGLEVELS[level], message, *args,
+                        extra={'message_type': message_type})
 
     def add_method(self, method):
         '''
@@ -203,7 +543,7 @@ class Trader(object):
         '''
         for item in self.subscriptions.keys():
             self.subscriptions.pop(item)
-            self.socketIO.off(item)
+            self._off(item)
         self.send("/logout")
 
     def _loop(self):
@@ -211,7 +551,13 @@ class Trader(object):
             self.socketIO.wait(1)
 
     def __exit__(self, *err):
-        pass
+        self.session.close()
+        if self.latency is not None:
+            self.latency.stop_logging()
+        if self.log_listener is not None:
+            self.log_listener.stop()
+        if self.dispatcher is not None:
+            self.dispatcher.stop()
 
     def __enter__(self):
         return self
@@ -224,23 +570,55 @@ class Trader(object):
             ret_value.update({'data': data})
         return ret_value
 
+    def _session_init(self):
+        '''
+        Creates the pooled HTTP session shared by every REST call, so
+        requests reuse warm keep-alive connections to the trading host
+        instead of opening a new TCP/TLS connection each time.
+        Sizing is read from the "http_pool" section of the config file:
+        connections - number of per-host pools to keep
+        maxsize - connections kept alive per host
+        block - wait for a free connection instead of exceeding maxsize
+        keep_alive - set to false to close the connection after each call
+
+        :return: None
+        '''
+        pool = self.CONFIG.get("http_pool", {})
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool.get("connections", 4),
+                              pool_maxsize=pool.get("maxsize", 10),
+                              pool_block=pool.get("block", False))
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        if pool.get("keep_alive", True) is False:
+            self.session.headers['Connection'] = 'close'
+
     def _send_request(self, method, command, params, additional_headers={}):        
         self.HEADERS['Authorization'] = self.bearerGen()
-        self.logger.info(self.environment.get(
-            "trading") + command + str(params))
+        self.logger.info("%s%s %s", self.environment.get("trading"),
+                         command, params)
+        start = time.time()
         if method == 'get':
-            rresp = requests.get(self.environment.get(
+            rresp = self.session.get(self.environment.get(
                 "trading") + command, params=params, headers=self.HEADERS)
         else:
             # params = json.dumps(params)
-            rresp = requests.post(self.environment.get(
+            rresp = self.session.post(self.environment.get(
                 "trading") + command, headers=self.HEADERS, data=params)
+        elapsed = time.time() - start
+        request = rresp.request
+        sent = len(request.url) + len(request.body or '')
         if rresp.status_code == 200:
             data = rresp.json()
-            if data["response"]["executed"] is True:
+            executed = data["response"]["executed"] is True
+            self.rest_metrics.record(command, elapsed, 200, executed, sent,
+                                     len(rresp.content))
+            if executed:
                 return self.__return(True, data)
             return self.__return(False, data["response"]["error"])
         else:
+            self.rest_metrics.record(command, elapsed, rresp.status_code,
+                                     False, sent, len(rresp.content))
             return self.__return(False, rresp.status_code)
              
     def send(self, location, params={}, method='post', additional_headers={}):
@@ -257,11 +635,31 @@ class Trader(object):
                 method, location, params, additional_headers)
             return response
         except Exception as e:
+            self.rest_metrics.record_error(location)
             self.logger.error("Failed to send request [%s]: %s" % (params, e))
             status = False
             response = str(e)
             return self.__return(status, response)
 
+    def rest_stats(self):
+        '''
+        Per endpoint REST metrics: calls, errors (no response),
+        not_executed (executed false), HTTP statuses, bytes in and out
+        and latency in seconds. Numeric path segments are folded, eg.
+        /candles/:id/m1.
+
+        :return: Dict of endpoint: Dict
+        '''
+        return self.rest_metrics.snapshot()
+
+    def rest_metrics_text(self):
+        '''
+        The REST metrics in the Prometheus text exposition format.
+
+        :return: str
+        '''
+        return self.rest_metrics.prometheus()
+
     def _get_config(self, environment):
         ret = self.CONFIG.get("environments", {}).get(environment, {})
         if ret == {}:
@@ -279,7 +677,16 @@ class Trader(object):
         formatter = logging.Formatter(
             '%(asctime)s - %(name)s - %(levelname)s - %(message)s')
         self.ch.setFormatter(formatter)
-        self.logger.addHandler(self.ch)
+        if self.CONFIG.get('log_async'):
+            # the calling thread only queues the record; formatting and
+            # writing happen on the listener thread
+            records = queue.Queue()
+            self.log_listener = logging.handlers.QueueListener(
+                records, self.ch, respect_handler_level=True)
+            self.log_listener.start()
+            self.logger.addHandler(_RecordQueueHandler(records))
+        else:
+            self.logger.addHandler(self.ch)
 
     def _forget(self, subscribed_item):
         if subscribed_item in self.subscriptions:
@@ -298,6 +705,10 @@ class Trader(object):
         '''
         self.logger.setLevel(self.LOGLEVELS.get(level, "ERROR"))
         self.ch.setLevel(self.LOGLEVELS.get(level, "ERROR"))
+        # level name -> enabled, so Print can skip suppressed messages
+        # with one lookup
+        self.log_enabled = dict((name, self.logger.isEnabledFor(number))
+                                for name, number in self.LOGLEVELS.items())
 
     def _add_method(self):
         pass
@@ -318,18 +729,198 @@ class Trader(object):
 
         :return: None
         '''
+        self.ready.clear()
         self.logger.info("Websocket closed")
 
-    def register_handler(self, message, handler):
+    def register_handler(self, message, handler, decoded=False):
         '''
         Register a callback handler for a specified message type
 
         :param message: string
         :param handler: function
+        :param decoded: True to pass handler the decoded message
         :return: None
         '''
-        self.socketIO.on(message, handler)
+        self._on(message, handler, decoded)
+
+    def _on(self, event, handler, decoded=False, queued=True):
+        '''
+        Registers handler for socket event through the dispatcher, which
+        decodes each payload once (with self.decode) for handlers that
+        take decoded messages and passes the raw payload to the others.
+        With dispatch workers configured, the socket thread only queues
+        the raw payload; decoding and handler run on a worker. With
+        dispatch shards, model updates are keyed by their record id
+        (orderId, tradeId, ...) and price updates by symbol. With latency
+        enabled, price updates are stamped on receipt and timed.
+        '''
+        decoded = decoded or getattr(handler, 'decoded', False)
+        self.handlers[event] = (handler, decoded, queued)
+        timed = queued and self.latency is not None and \
+            event not in self.MODELS
+        if timed:
+            handler = self._timing(event, handler, decoded)
+            decoded = False
+        if queued and self.dispatcher is not None:
+            if self.dispatcher.keyed and event in self.MODELS:
+                handler = self._sharding(event, handler, decoded)
+            else:
+                if decoded:
+                    handler = self._decoding(event, handler)
+                handler = functools.partial(self.dispatcher.put, event,
+                                            handler)
+        elif decoded:
+            handler = self._decoding(event, handler)
+        if timed:
+            handler = self._receiving(handler)
+        self.socket_handlers[event] = handler
+        if self.recorder is not None:
+            handler = self._recording(event, handler)
+        self.socketIO.on(event, handler)
+
+    def _off(self, event):
+        self.handlers.pop(event, None)
+        self.socket_handlers.pop(event, None)
+        self.socketIO.off(event)
+
+    def _recording(self, event, handler):
+        write = self.recorder.write
+
+        def record(msg):
+            write(event, msg)
+            handler(msg)
+        return record
+
+    def record(self, path):
+        '''
+        Starts appending every socket message (price and model updates),
+        as received and with its receipt time, to the binary file path.
+        Play it back with replay.
+
+        :param path: recording file
+        :return: TickRecorder
+        '''
+        self.stop_recording()
+        self.recorder = TickRecorder(path)
+        if self.socketIO is not None:
+            for event, handler in self.socket_handlers.items():
+                self.socketIO.on(event, self._recording(event, handler))
+        return self.recorder
+
+    def stop_recording(self):
+        '''
+        Stops recording socket messages.
 
+        :return: number of messages recorded
+        '''
+        recorder, self.recorder = self.recorder, None
+        if recorder is None:
+            return 0
+        if self.socketIO is not None:
+            for event, handler in self.socket_handlers.items():
+                self.socketIO.on(event, handler)
+        recorder.close()
+        return recorder.count
+
+    def replay(self, path, speed=None):
+        '''
+        Feeds the messages recorded in path through the handlers that
+        would receive them live: those registered for the event, else
+        update_handlers for models and on_price_update for symbols. No
+        connection is needed, so handler throughput can be measured and
+        regression tested offline.
+
+        :param path: recording file
+        :param speed: * Optional * 1 for real time, N for N times faster,
+                      None for as fast as possible
+        :return: number of messages replayed
+        '''
+        replayer = TickReplayer(path)
+        try:
+            return replayer.replay(self._replay_message, speed)
+        finally:
+            replayer.close()
+
+    def _replay_message(self, event, payload):
+        handler = self.socket_handlers.get(event)
+        if handler is None:
+            handler = self.update_handlers.get(event, self.on_price_update)
+        handler(payload)
+
+    def _decoding(self, event, handler):
+        def dispatch(msg):
+            try:
+                message = self.decode(msg)
+            except Exception as e:
+                self.logger.error("Can't decode %s update: %s" % (event, e))
+                return
+            handler(message)
+        return dispatch
+
+    def _sharding(self, event, handler, decoded):
+        # the key is inside the payload, so it is decoded here, on the
+        # socket thread; handlers not taking decoded messages get the raw
+        # payload as usual
+        key_field = self.MODELS[event][1]
+        put = self.dispatcher.put
+
+        def dispatch(msg):
+            try:
+                message = self._message(msg)
+            except Exception as e:
+                self.logger.error("Can't decode %s update: %s" % (event, e))
+                return
+            put(message.get(key_field, event), handler,
+                message if decoded else msg)
+        return dispatch
+
+    @staticmethod
+    def _receiving(handler):
+        def stamp(msg):
+            handler((time.time(), msg))
+        return stamp
+
+    def _timing(self, event, handler, decoded):
+        # takes (receipt time, payload) from _receiving
+        record = self.latency.record
+
+        def timed(item):
+            received, msg = item
+            start = time.time()
+            try:
+                message = self._message(msg)
+            except Exception as e:
+                self.logger.error("Can't decode %s update: %s" % (event, e))
+                return
+            handler(message if decoded else msg)
+            end = time.time()
+            updated = message.get('Updated', received)
+            if updated > 1e11:
+                # milliseconds
+                updated = updated / 1000.0
+            record(event, received - updated, start - received, end - start)
+        return timed
+
+    def latency_stats(self):
+        '''
+        Price update latency per symbol, in seconds: network (server
+        Updated time to receipt), queue (receipt to handler start) and
+        handler (handler run time). Empty unless latency is enabled.
+
+        :return: Dict of symbol: {stage: {'count', 'mean', 'p50', 'p99',
+                 'max'}}
+        '''
+        if self.latency is None:
+            return {}
+        return self.latency.snapshot()
+
+    def _message(self, msg):
+        # handlers may still be called with the raw payload directly
+        if isinstance(msg, (str, bytes)):
+            return self.decode(msg)
+        return msg
+
+    @takes_decoded
     def on_price_update(self, msg):
         '''
         Sample price handler. If on_price_update is registered for a symbol,
@@ -339,64 +930,99 @@ class Trader(object):
         :return: none
         '''
         try:
-            md = json.loads(msg)
+            md = self._message(msg)
             symbol = md["Symbol"]
-            symbol_info = self.symbol_info.get(symbol, {})
-            p_up = dict(symbol_info=self.symbol_info[symbol], parent=self)
-            self.symbols[symbol] = self.symbols.get(symbol, PriceUpdate(p_up,
-                                                    symbol_info=symbol_info))
-            self.symbols[symbol].bid, self.symbols[symbol].ask,\
-                self.symbols[symbol].high,\
-                self.symbols[symbol].low = md['Rates']
-            self.symbols[symbol].updated = md['Updated']
+            price = self.symbols.get(symbol)
+            if price is None:
+                price = self.symbols[symbol] = PriceUpdate(
+                    symbol_info=self.symbol_info.get(symbol), parent=self,
+                    symbol=symbol)
+            rates = md['Rates']
+            price.bid, price.ask, price.high, price.low = rates
+            price.updated = updated = md['Updated']
+            if self.tick_history_depth:
+                history = self.tick_history.get(symbol)
+                if history is None:
+                    history = self.tick_history[symbol] = TickBuffer(
+                        self.tick_history_depth)
+                history.append(updated, *rates)
+            if self.pnl is not None:
+                self.pnl.mark(symbol, rates[0], rates[1])
+            aggregators = self.bar_aggregators.get(symbol)
+            if aggregators:
+                for aggregator in aggregators.values():
+                    aggregator.update(updated, rates[0], rates[1])
         except Exception as e:
             self.logger.error("Can't handle price update: " + str(e))
 
+    @takes_decoded
     def on_offer(self, msg):
-        message = json.loads(msg)
-        self.Print("Offer Update:" + message, "Offer", "INFO")
+        message = self._message(msg)
+        self._model_update("Offer", message)
+        self.Print("Offer Update: %s", "Offer", "INFO", message)
 
+    @takes_decoded
     def on_account(self, msg):
-        message = json.loads(msg)
+        message = self._message(msg)
+        self._model_update("Account", message)
         account_id = message['accountId']
         self.accounts[account_id] = self.accounts.get(account_id, {})
         self.accounts[account_id].update(message)
         # self.Print("Account Update:" + msg, "Account", "INFO")
 
+    @takes_decoded
     def on_order(self, msg):
-        message = json.loads(msg)
-        order_id = message.get('orderId', '')
-        trade_id = message.get('tradeId', '')
-        self.orders_list[order_id] = self.orders_list.get(order_id,
-                                                          {'actions': []})
-        if "action" in message:
-            self.orders_list[order_id]['actions'].append(message)
-        self.orders_list[order_id].update(message)
-        self.Print("Order Update:" + msg, "Order", "INFO")
-
+        message = self._message(msg)
+        self._model_update("Order", message)
+        order = self.order_index.update(message)
+        self.exposure.order(order.get('orderId', ''),
+                            None if message.get('action') == 'D' else order)
+        self.Print("Order Update: %s", "Order", "INFO", message)
+
+    @takes_decoded
     def on_openposition(self, msg):
-        message = json.loads(msg)
-        self.Print("OpenPosition Update:" + msg, "OpenPosition", "INFO")
-
+        message = self._message(msg)
+        self._model_update("OpenPosition", message)
+        position = self.position_book.update(message)
+        if 'tradeId' in message:
+            self.exposure.position(message['tradeId'], position)
+            if self.pnl is not None:
+                self.pnl.set(message['tradeId'], position)
+        self.Print("OpenPosition Update: %s",
+                   "OpenPosition", "INFO", message)
+
+    @takes_decoded
     def on_closedposition(self, msg):
-        message = json.loads(msg)
-        self.Print("ClosedPosition Update:" + msg,
-                   "ClosedPosition", "INFO")
-
+        message = self._message(msg)
+        self._model_update("ClosedPosition", message)
+        self.position_book.close(message)
+        if 'tradeId' in message:
+            self.exposure.position(message['tradeId'], None)
+            if self.pnl is not None:
+                self.pnl.remove(message['tradeId'])
+        self.Print("ClosedPosition Update: %s",
+                   "ClosedPosition", "INFO", message)
+
+    @takes_decoded
     def on_summary(self, msg):
-        message = json.loads(msg)
-        self.Print("Summary Update:" + msg, "Summary", "INFO")
+        message = self._message(msg)
+        self._model_update("Summary", message)
+        self.Print("Summary Update: %s", "Summary", "INFO", message)
 
+    @takes_decoded
     def on_properties(self, msg):
-        message = json.loads(msg)
+        message = self._message(msg)
+        self._model_update("Properties", message)
         if "offerId" in message:
             message['symbol'] = self.symbol_id[message['offerId']]
-        self.Print("Property Update:" + msg, "Property", "INFO")
+        self.Print("Property Update: %s", "Property", "INFO", message)
 
+    @takes_decoded
     def on_leverageprofile(self, msg):
-        message = json.loads(msg)
-        self.Print("LeverageProfile Update:" + msg,
-                   "LeverageProfile", "INFO")
+        message = self._message(msg)
+        self._model_update("LeverageProfile", message)
+        self.Print("LeverageProfile Update: %s",
+                   "LeverageProfile", "INFO", message)
 
     def on_message(self, msg):
         '''
@@ -407,6 +1033,55 @@ class Trader(object):
         '''
         self.Print(msg, -1, "INFO")
 
+    def _model_update(self, item, message):
+        '''
+        Applies a socket update to the local copy of model item. Updates
+        arriving while the copy is being seeded are replayed afterwards.
+        '''
+        with self._models_lock:
+            pending = self._models_pending.get(item)
+            if pending is not None:
+                pending.append(message)
+                return
+            records = self.models.get(item)
+            if records is not None:
+                self._apply_model_update(records, self.MODELS[item][1],
+                                         message)
+
+    @staticmethod
+    def _apply_model_update(records, key, message):
+        # records are replaced rather than changed in place, so lists
+        # already handed out by get_model do not change under the caller
+        record_id = message.get(key, '')
+        if message.get('action') == 'D':
+            records.pop(record_id, None)
+        else:
+            record = dict(records.get(record_id, {}))
+            record.update(message)
+            record.pop('action', None)
+            records[record_id] = record
+
+    def _seed_model(self, item):
+        with self._models_lock:
+            if item in self._models_pending:
+                seeding = True
+            else:
+                seeding = False
+                self._models_pending[item] = []
+        response = self.send("/trading/get_model", {"models": item}, "get")
+        if seeding:
+            return response
+        with self._models_lock:
+            pending = self._models_pending.pop(item)
+            if response['status'] is True and item in self._models_live:
+                name, key = self.MODELS[item]
+                records = dict((record.get(key, ''), record)
+                               for record in response.get(name, []))
+                for message in pending:
+                    self._apply_model_update(records, key, message)
+                self.models[item] = records
+        return response
+
     @property
     def summary(self):
         '''
@@ -438,21 +1113,41 @@ class Trader(object):
     def properties(self):
         return self.get_model("Properties").get('properties', [])
 
-    def subscribe_symbol(self, instruments, handler=None):
+    def subscribe_symbol(self, instruments, handler=None, decoded=False,
+                         conflate=None):
         '''
         Subscribe to given instrument
 
         :param instruments:
+        :param handler: * Optional * defaults to on_price_update
+        :param decoded: True to pass handler the decoded message
+        :param conflate: * Optional * seconds. Run handler on its own thread
+                         with at most one (the newest) update per instrument
+                         per conflate seconds; 0 for whenever handler is
+                         ready. Skipped updates are counted, see
+                         conflation_stats
         :return: response Dict
         '''
         handler = handler or self.on_price_update
-        if type(instruments) is list:
-            for instrument in instruments:
-                self.subscriptions[instrument] = instrument
-                self.socketIO.on(instrument, handler)
-        else:
-            self.subscriptions[instruments] = instruments
-            self.socketIO.on(instruments, handler)
+        conflator = None
+        if conflate is not None:
+            if decoded or getattr(handler, 'decoded', False):
+                # decode only the updates that are delivered
+                handler = self._decoding('price', handler)
+            conflator = Conflator(handler, conflate, 'conflate-%s' %
+                                  instruments)
+        for instrument in (instruments if type(instruments) is list
+                           else [instruments]):
+            self.subscriptions[instrument] = instrument
+            self._forget_conflator(instrument)
+            if conflator is None:
+                self._on(instrument, handler, decoded)
+            else:
+                self.conflators[instrument] = conflator
+                # already off the socket thread, no need to queue
+                self._on(instrument,
+                         functools.partial(conflator.put, instrument),
+                         queued=False)
         return self.send("/subscribe", {"pairs": instruments},
                          additional_headers={'Transfer-Encoding': "chunked"})
 
@@ -467,13 +1162,47 @@ class Trader(object):
         if type(instruments) is list:
             for instrument in instruments:
                 self._forget(instrument)
-                self.socketIO.off(instrument)
+                self._forget_conflator(instrument)
+                self._off(instrument)
         else:
-            self.socketIO.off(instruments)
+            self._off(instruments)
             self._forget(instruments)
+            self._forget_conflator(instruments)
         return self.send("/unsubscribe", {"pairs": instruments})
 
-    def subscribe(self, items, handler=None):
+    def _forget_conflator(self, instrument):
+        conflator = self.conflators.pop(instrument, None)
+        if conflator is not None and \
+                conflator not in self.conflators.values():
+            conflator.stop()
+
+    def conflation_stats(self):
+        '''
+        Delivered and dropped (replaced by a newer update before delivery)
+        price update counts of conflated subscriptions.
+
+        :return: Dict of instrument: {'delivered': n, 'dropped': n}
+        '''
+        stats = {}
+        for conflator in set(self.conflators.values()):
+            stats.update(conflator.stats())
+        return stats
+
+    def dispatch_stats(self):
+        '''
+        Queue depth, drop and lag figures of the dispatch queues, per
+        socket event (or per shard with dispatch shards). Empty unless
+        dispatch workers or shards are configured.
+
+        :return: Dict of event: {'depth', 'max_depth', 'enqueued',
+                 'handled', 'dropped', 'lag_avg', 'lag_max'}, or
+                 shard: {'depth', 'handled', 'lag_avg', 'lag_max'}
+        '''
+        if self.dispatcher is None:
+            return {}
+        return self.dispatcher.stats()
+
+    def subscribe(self, items, handler=None, decoded=False):
         '''
         Subscribes to the updates of the data models.
         Update will be pushed to client via socketIO
@@ -481,16 +1210,19 @@ class Trader(object):
         'Order',  'Account',  'Summary', 'LeverageProfile', 'Properties'
 
         :param item:
+        :param handler: * Optional * defaults to on_message
+        :param decoded: True to pass handler the decoded message
         :return: response Dict
         '''
         handler = handler or self.on_message
         response = self.send("/trading/subscribe", {"models": items})
         if response['status'] is True:
-            if type(items) is list:
-                for item in items:
-                    self.socketIO.on(item, handler)
-            else:
-                self.socketIO.on(items, handler)
+            for item in (items if type(items) is list else [items]):
+                self._on(item, handler, decoded)
+                if item in self.MODELS and \
+                        handler == self.update_handlers.get(item):
+                    with self._models_lock:
+                        self._models_live.add(item)
         else:
             self.logger.error(
                 "Error processing /trading/subscribe:" + str(response))
@@ -504,38 +1236,157 @@ class Trader(object):
         :param item:
         :return: response Dict
         '''
-        if type(items) is list:
-            for item in items:
-                self._forget(item)
-                self.socketIO.off(item)
-        else:
-            self._forget(items)
-            self.socketIO.off(items)
+        for item in (items if type(items) is list else [items]):
+            self._forget(item)
+            self._off(item)
+            with self._models_lock:
+                self._models_live.discard(item)
+                self.models.pop(item, None)
         return self.send("/trading/unsubscribe", {"models": items})
 
+    def build_bars(self, symbol, periods, on_bar=None, history=1000):
+        '''
+        Keeps live bars of the given periods for symbol, built from its
+        price updates, so they need not be polled with get_candles. The
+        symbol must be subscribed with the default on_price_update handler.
+        Each period is seeded from one get_candles call.
+
+        :param symbol:
+        :param periods: period or list of periods: m1, m5, m15, m30, H1,
+                        H2, H3, H4, H6, H8, D1, W1
+        :param on_bar: * Optional * function called as
+                       on_bar(symbol, period, bar) for each completed bar,
+                       bar being in the get_candles layout
+        :param history: completed bars to keep, and candles to seed with
+        :return: response Dict with status and period: BarAggregator
+        '''
+        periods = periods if type(periods) is list else [periods]
+        for period in periods:
+            if period not in self.PERIODS or period == 'M1':
+                return self.__return(False, "Can't build %s bars" % period)
+        aggregators = dict(self.bar_aggregators.get(symbol, {}))
+        for period in periods:
+            callback = None
+            if on_bar is not None:
+                def callback(bar, period=period):
+                    on_bar(symbol, period, bar)
+            aggregator = BarAggregator(self.PERIODS[period], history,
+                                       callback)
+            candles = self.get_candles(symbol, period, history)
+            if candles['status'] is True:
+                aggregator.seed(candles['candles'])
+            else:
+                self.logger.error("Can't seed %s %s bars: %s" %
+                                  (symbol, period, candles))
+            aggregators[period] = aggregator
+        # replaced rather than changed, as the socket thread iterates it
+        self.bar_aggregators[symbol] = aggregators
+        return self.__return(True, aggregators)
+
+    def position(self, symbol, account_id=None):
+        '''
+        Net position of symbol from the position book, without a REST
+        call: count, net_amountK, buy_amountK, sell_amountK, average_buy,
+        average_sell, average_open, closed_count and realized_pl.
+
+        :param symbol:
+        :param account_id: * Optional * one account instead of all
+        :return: Dict
+        '''
+        return self.position_book.symbol(symbol, account_id)
+
+    def floating_pl(self, account_id=None):
+        '''
+        Floating P&L of the open positions at the latest prices, per
+        account, as kept by the P&L engine (see fxcm_pnl) without a REST
+        call. Symbols without price updates count as 0.
+
+        :param account_id: * Optional * one account instead of all
+        :return: Dict of accountId: P&L, or the P&L of account_id
+        '''
+        if self.pnl is None:
+            return {} if account_id is None else None
+        totals = self.pnl.accounts()
+        if account_id is None:
+            return totals
+        return totals.get(account_id, 0.0)
+
     def get_tradeId(self, orderId):
-        try:
-            orderId = str(orderId)
-            tradeId = None
-            order = self.orders_list.get(orderId, {})
-            for action in order.get('actions', []):
-                tradeId = action.get('tradeId', None)
-                if tradeId is not None:
-                    break
-            return tradeId
-        except Exception as e:
-            return {'Error': 'Error ' + str(e)}
+        '''
+        Returns the tradeId of the trade orderId opened or closed, as seen
+        on the Order updates, or None if not known (yet).
+
+        :param orderId:
+        :return: tradeId
+        '''
+        return self.order_index.trade_id(orderId)
+
+    def order_accepted(self, orderId):
+        '''
+        Future resolved with the order's state record when its first Order
+        update arrives, eg. trader.order_accepted(orderId).result(5).
+        Needs the Order subscription.
+
+        :param orderId:
+        :return: concurrent.futures.Future
+        '''
+        return self.order_index.accepted(orderId)
+
+    def order_filled(self, orderId):
+        '''
+        Future resolved with the tradeId once an Order update links the
+        order to its trade, or with None if the order is deleted without
+        one. Needs the Order subscription.
+
+        :param orderId:
+        :return: concurrent.futures.Future
+        '''
+        return self.order_index.filled(orderId)
+
+    def get_orderIds(self, tradeId):
+        '''
+        Returns the orderIds linked to tradeId (the one that opened it,
+        and any closing it), oldest first.
+
+        :param tradeId:
+        :return: list of orderIds
+        '''
+        return self.order_index.order_ids(tradeId)
 
-    def get_model(self, item):
+    def open_orders_for(self, symbol=None):
+        '''
+        Returns the ids of the orders still open (not filled, cancelled or
+        expired) for symbol, or for all symbols, as seen on Order updates.
+
+        :param symbol: * Optional *
+        :return: set of orderIds
+        '''
+        return self.order_index.open_orders(symbol)
+
+    def get_model(self, item, fresh=False):
         '''
         Gets current content snapshot of the specified data models.
         Model choices:
         'Offer', 'OpenPosition', 'ClosedPosition', 'Order', 'Summary',
         'LeverageProfile', 'Account', 'Properties'
 
+        Models subscribed with their default update handler are fetched
+        once and then kept current from the socket updates, so later calls
+        (and the summary, offers, open_positions, ... properties) are
+        answered locally.
+
         :param item:
+        :param fresh: True to refetch the model over REST
         :return: response Dict
         '''
+        if type(item) is not list and item in self._models_live:
+            if not fresh:
+                with self._models_lock:
+                    records = self.models.get(item)
+                    if records is not None:
+                        return self.__return(True, {
+                            self.MODELS[item][0]: list(records.values())})
+            return self._seed_model(item)
         return self.send("/trading/get_model", {"models": item}, "get")
 
     def change_password(self, oldpwd, newpwd):
@@ -631,6 +1482,57 @@ class Trader(object):
             params['rate'] = rate
         return self.send("/trading/close_trade", params)
 
+    def _batch(self, method, specs, concurrency=None):
+        '''
+        Runs method once per spec on up to concurrency threads, sharing the
+        pooled session. A spec is a dict of keyword arguments, a list/tuple
+        of positional arguments or a single argument.
+        Results are returned in the order of specs.
+        '''
+        def run(spec):
+            try:
+                if isinstance(spec, dict):
+                    return method(**spec)
+                if isinstance(spec, (list, tuple)):
+                    return method(*spec)
+                return method(spec)
+            except Exception as e:
+                return self.__return(False, str(e))
+
+        specs = list(specs)
+        if not specs:
+            return []
+        if concurrency is None:
+            concurrency = self.CONFIG.get('http_pool', {}).get('maxsize', 10)
+        workers = max(1, min(concurrency, len(specs)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(run, specs))
+
+    def open_trades_batch(self, orders, concurrency=None):
+        '''
+        Submit several market orders concurrently.
+
+        :param orders: list of open_trade arguments, eg.
+                       [dict(account_id=a, symbol="EUR/USD", is_buy=True,
+                             amount=1), ...]
+        :param concurrency: * Optional * max requests in flight.
+                            Defaults to the http_pool maxsize
+        :return: list of response Dicts in the order of orders
+        '''
+        return self._batch(self.open_trade, orders, concurrency)
+
+    def close_trades_batch(self, trades, concurrency=None):
+        '''
+        Close several trades concurrently.
+
+        :param trades: list of close_trade arguments, eg.
+                       [dict(trade_id=t, amount=1), ...]
+        :param concurrency: * Optional * max requests in flight.
+                            Defaults to the http_pool maxsize
+        :return: list of response Dicts in the order of trades
+        '''
+        return self._batch(self.close_trade, trades, concurrency)
+
     def change_order(self, order_id, rate, rng, amount, trailing_step=None):
         '''
         Change order rate/amount
@@ -664,6 +1566,17 @@ class Trader(object):
         params = dict(order_id=order_id)
         return self.send("/trading/delete_order", params)
 
+    def delete_orders_batch(self, order_ids, concurrency=None):
+        '''
+        Delete several open orders concurrently.
+
+        :param order_ids: list of order ids
+        :param concurrency: * Optional * max requests in flight.
+                            Defaults to the http_pool maxsize
+        :return: list of response Dicts in the order of order_ids
+        '''
+        return self._batch(self.delete_order, order_ids, concurrency)
+
     def create_entry_order(self, account_id, symbol, is_buy, rate, amount, is_in_pips, 
                            order_type, time_in_force, limit=None,
                             stop=None, trailing_step=None):
@@ -871,7 +1784,8 @@ class Trader(object):
             return self.__return(False, str(e))
 
     def get_candles(self, instrument, period, num,
-                    From=None, To=None, dt_fmt=None):
+                    From=None, To=None, dt_fmt=None, as_array=False,
+                    tz=None):
         '''
         Allow user to retrieve candle for a given instrument at a give time
 
@@ -887,42 +1801,205 @@ class Trader(object):
         .candles("USD/JPY", "m1", 3, datetime_fmt="%Y/%m/%d %H:%M:%S:%f")
         [1503694620, 109.321, 109.326, 109.326, 109.316, 109.359,
         109.358, 109.362, 109.357, 28, '2017/08/26 05:57:00:000000']
+        :param as_array: * Optional * True to return the candles as a NumPy
+                         structured array with a field per header
+        :param tz: * Optional * time zone (tzinfo or name, eg. "UTC") used
+                   for dt_fmt. Defaults to the host's local zone
         :return: response Dict
         '''
         try:
-            initial_instrument = instrument
-            if not isInt(instrument):
-                instrument = self.symbol_info.get(
-                    instrument, {}).get('offerId', -1)
-            if instrument < 0:
-                raise ValueError("Instrument %s not found" %
-                                 initial_instrument)
+            instrument = self._offer_id(instrument)
             if num > 10000:
                 num = 10000
-            params = dict(num=num)
-            for k, v in {"From": From, "To": To}.items():
-                if v is not None:
-                    if not isInt(v):
-                        v = int(time.mktime(parse(v).timetuple()))
-                    params[k] = v
-            candle_data = self.send("/candles/%s/%s" %
-                                    (instrument, period), params, "get")
-            headers = ['timestamp', 'bidopen', 'bidclose', 'bidhigh', 'bidlow',
-                       'askopen', 'askclose', 'askhigh', 'asklow', 'tickqty']
-            if dt_fmt is not None:
-                headers.append("datestring")
-                for i, candle in enumerate(candle_data['candles']):
-                    candle_data['candles'][i].append(
-                        datetime.fromtimestamp(candle[0]).strftime(dt_fmt))
-            candle_data['headers'] = headers
-            return self.__return(candle_data['status'], candle_data)
+            if From is not None and self.candle_store is not None:
+                # only the last num periods before To are read or fetched
+                end = to_timestamp(To) if To is not None \
+                    else int(time.time())
+                start = max(to_timestamp(From),
+                            end - num * self.PERIODS[period])
+                candle_data = self._stored_candles(instrument, period,
+                                                   start, end)
+                candle_data['candles'] = candle_data['candles'][-num:]
+            else:
+                candle_data = self._request_candles(instrument, period, num,
+                                                    From, To)
+            return self._format_candles(candle_data, dt_fmt, as_array, tz)
         except Exception as e:
-            return (False, str(e))
+            return self.__return(False, str(e))
 
     candles = get_candles
 
+    def _offer_id(self, instrument):
+        initial_instrument = instrument
+        if not isInt(instrument):
+            instrument = self.symbol_info.get(
+                instrument, {}).get('offerId', -1)
+        if instrument < 0:
+            raise ValueError("Instrument %s not found" %
+                             initial_instrument)
+        return instrument
+
+    def _request_candles(self, instrument, period, num, From=None, To=None):
+        params = dict(num=num)
+        for k, v in {"From": From, "To": To}.items():
+            if v is not None:
+                params[k] = to_timestamp(v)
+        return self.send("/candles/%s/%s" % (instrument, period), params,
+                         "get")
+
+    def _format_candles(self, candle_data, dt_fmt, as_array, tz=None):
+        candles = candle_data['candles']
+        if as_array:
+            # stored candles already are a structured array
+            if type(candles) is list or dt_fmt is not None:
+                if type(candles) is not list:
+                    candles = candles.tolist()
+                candles = candles_to_array(candles, dt_fmt, tz)
+            headers = list(candles.dtype.names)
+        else:
+            if type(candles) is not list:
+                candles = [list(candle) for candle in candles.tolist()]
+            headers = self._candle_headers(candles, dt_fmt, tz)
+        candle_data['candles'] = candles
+        candle_data['headers'] = headers
+        return self.__return(candle_data['status'], candle_data)
+
+    def _candle_headers(self, candles, dt_fmt=None, tz=None):
+        '''
+        Returns the candle field names, first adding the datestring field
+        to each of candles if dt_fmt is given.
+        '''
+        headers = list(CANDLE_HEADERS)
+        if dt_fmt is not None:
+            headers.append("datestring")
+            datestrings = format_timestamps([candle[0] for candle in candles],
+                                            dt_fmt, tz)
+            for candle, datestring in zip(candles, datestrings):
+                candle.append(datestring)
+        return headers
+
+    def get_candles_range(self, instrument, period, From, To=None,
+                          dt_fmt=None, concurrency=None, retries=2,
+                          progress=None, as_array=False, tz=None):
+        '''
+        Retrieve every candle between From and To, however many there are.
+        The span is split into windows of at most 10,000 candles which are
+        fetched concurrently; windows that fail are retried. The candles
+        are merged into one time ordered list without duplicates.
+
+        :param instrument: instrument_id or instrument
+        :param period: m1, m5, m15, m30, H1, H2, H3, H4, H6, H8, D1, W1, M1
+        :param From: timestamp or date/time string
+        :param To: * Optional * timestamp or date/time string (default now)
+        :param dt_fmt: * Optional * as for get_candles
+        :param concurrency: * Optional * windows fetched at once.
+                            Defaults to the http_pool maxsize
+        :param retries: times a failed window is retried
+        :param progress: * Optional * function called as
+                         progress(windows_done, windows_total)
+        :param as_array: * Optional * as for get_candles
+        :param tz: * Optional * as for get_candles
+        :return: response Dict. If windows still fail after the retries,
+                 status is False, candles holds what was retrieved and
+                 'failed' lists the missing (From, To) windows
+        '''
+        try:
+            instrument = self._offer_id(instrument)
+            if self.candle_store is not None:
+                candle_data = self._stored_candles(
+                    instrument, period, From, To, concurrency, retries,
+                    progress)
+            else:
+                end = to_timestamp(To) if To is not None else int(time.time())
+                candles, failed = self._download_candles(
+                    instrument, period, to_timestamp(From), end, concurrency,
+                    retries, progress)
+                candle_data = dict(status=not failed, instrument_id=instrument,
+                                   period_id=period, candles=candles)
+                if failed:
+                    candle_data['failed'] = failed
+            return self._format_candles(candle_data, dt_fmt, as_array, tz)
+        except Exception as e:
+            return self.__return(False, str(e))
+
+    def _download_candles(self, instrument, period, start, end,
+                          concurrency=None, retries=2, progress=None):
+        '''
+        Downloads the candles between start and end in concurrent windows.
+        Returns the time ordered candles and the windows that still failed
+        after the retries.
+        '''
+        span = self.PERIODS[period] * (10000 - 1)
+        windows = [(t, min(t + span, end))
+                   for t in range(start, max(end, start + 1), span)]
+        done = [0]
+        lock = threading.Lock()
+
+        def fetch(window):
+            response = self._request_candles(instrument, period, 10000,
+                                             window[0], window[1])
+            if response['status'] is True and progress is not None:
+                with lock:
+                    done[0] += 1
+                    progress(done[0], len(windows))
+            return response
+
+        responses = [None] * len(windows)
+        todo = list(range(len(windows)))
+        for attempt in range(retries + 1):
+            results = self._batch(fetch, [[windows[i]] for i in todo],
+                                  concurrency)
+            failed = []
+            for i, response in zip(todo, results):
+                if response['status'] is True:
+                    responses[i] = response
+                else:
+                    failed.append(i)
+            todo = failed
+            if not todo:
+                break
+        # neighbouring windows share their edge candle
+        by_time = {}
+        for response in responses:
+            if response is not None:
+                for candle in response['candles']:
+                    by_time[candle[0]] = candle
+        candles = [by_time[t] for t in sorted(by_time)]
+        return candles, [windows[i] for i in todo]
+
+    def _stored_candles(self, instrument, period, From, To=None,
+                        concurrency=None, retries=2, progress=None):
+        '''
+        Answers a From/To candle request from candle_store, downloading
+        only the ranges the store does not cover yet.
+        '''
+        seconds = self.PERIODS[period]
+        now = int(time.time())
+        start = to_timestamp(From)
+        end = to_timestamp(To) if To is not None else now
+        failed = []
+        for low, high in self.candle_store.missing(instrument, seconds,
+                                                   start, end):
+            candles, missed = self._download_candles(
+                instrument, period, low, high, concurrency, retries, progress)
+            # the candle still in progress is fetched again next time
+            high = min(high, now - seconds)
+            if missed:
+                failed.extend(missed)
+            elif high > low:
+                self.candle_store.add(instrument, seconds, low, high,
+                                      candles_to_array(candles))
+        candles = self.candle_store.read(instrument, seconds, start, end)
+        candle_data = dict(status=not failed, instrument_id=instrument,
+                           period_id=period,
+                           candles=candles if candles is not None else [])
+        if failed:
+            candle_data['failed'] = failed
+        return candle_data
+
     def candles_as_dict(self, instrument, period, num,
-                        From=None, To=None, dt_fmt=None):
+                        From=None, To=None, dt_fmt=None, as_array=False,
+                        tz=None):
         '''
         Allow user to retrieve candle for a given instrument at a give time
         as a dictionary.
@@ -939,13 +2016,21 @@ class Trader(object):
         .candles("USD/JPY", "m1", 3, datetime_fmt="%Y/%m/%d %H:%M:%S:%f")
         [1503694620, 109.321, 109.326, 109.326, 109.316, 109.359,
         109.358, 109.362, 109.357, 28, '2017/08/26 05:57:00:000000']
+        :param as_array: * Optional * True to return the candles as a dict
+                         of NumPy column arrays keyed by the header names
+        :param tz: * Optional * as for get_candles
         :return: response Dict
         '''
         try:
             candle_data = self.get_candles(
-                instrument, period, num, From, To, dt_fmt)
+                instrument, period, num, From, To,
+                None if as_array else dt_fmt, tz=tz)
             status = candle_data['status']
-            if status is True:
+            if status is True and as_array:
+                candle_data['candles'] = candles_to_columns(
+                    candle_data['candles'], dt_fmt, tz)
+                candle_data['headers'] = list(candle_data['candles'])
+            elif status is True:
                 Headers = namedtuple('Headers', candle_data['headers'])
                 candle_dict = map(Headers._make, candle_data['candles'])
                 candle_data['candles'] = candle_dict
@@ -966,6 +2051,20 @@ class Trader(object):
         except Exception as e:
             logging.error("Error loading self.CONFIG: " + str(e))
         self.debug_level = self.CONFIG.get("DEBUGLEVEL", "ERROR")
+        # model: (get_model response field, record id field)
+        self.MODELS = {"Offer": ("offers", "offerId"),
+                       "Account": ("accounts", "accountId"),
+                       "Order": ("orders", "orderId"),
+                       "OpenPosition": ("open_positions", "tradeId"),
+                       "ClosedPosition": ("closed_positions", "tradeId"),
+                       "Summary": ("summary", "offerId"),
+                       "LeverageProfile": ("leverage_profile", "offerId"),
+                       "Properties": ("properties", "offerId")}
+        # candle period lengths in seconds
+        self.PERIODS = {"m1": 60, "m5": 300, "m15": 900, "m30": 1800,
+                        "H1": 3600, "H2": 7200, "H3": 10800, "H4": 14400,
+                        "H6": 21600, "H8": 28800, "D1": 86400,
+                        "W1": 604800, "M1": 2678400}
         self.LOGLEVELS = {"ERROR": logging.ERROR,
                           "DEBUG": logging.DEBUG,
                           "INFO": logging.INFO,
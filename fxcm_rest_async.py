@@ -0,0 +1,404 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+import fxcm_rest_api_token as fxcm_rest_api
+
+
+class AsyncTrader(object):
+    '''asyncio front end for the FXCM REST API Trader.
+    Exposes the Trader methods as coroutines so many strategies can share
+    one event loop, one socket connection and one pooled HTTP session.
+
+    REST calls run on a small executor bounded by the http_pool size, so
+    any number of concurrent coroutines share at most that many threads.
+    Socket updates are handed from the single socket thread to the event
+    loop, where subscription handlers run (coroutine handlers are
+    scheduled as tasks).
+
+    Attributes not defined here (symbols, account_id, symbol_info, ...)
+    are read from the wrapped Trader.
+    '''
+
+    def __init__(self, access_token=None, environment=None, trader=None,
+                 max_workers=None, **kwargs):
+        '''
+        :param access_token: as for Trader
+        :param environment: as for Trader
+        :param trader: * Optional * existing Trader to wrap instead of
+                       creating one (eg. one pointed at a mock server)
+        :param max_workers: * Optional * concurrent REST calls. Defaults
+                            to the http_pool maxsize
+        :param kwargs: passed on to Trader
+        '''
+        if trader is None:
+            trader = fxcm_rest_api.Trader(access_token, environment,
+                                          **kwargs)
+        self.trader = trader
+        if max_workers is None:
+            max_workers = trader.CONFIG.get('http_pool', {}).get('maxsize',
+                                                                 10)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.loop = None
+        # socket event -> feeds of the open streams, see _tap
+        self._streams = {}
+        # the Trader's on_connect, wrapped by login to signal _connected
+        self._on_connect = None
+        self._connected = None
+
+    def __getattr__(self, name):
+        return getattr(self.trader, name)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *err):
+        await self.close()
+
+    async def close(self):
+        '''
+        Shuts down the REST executor and the pooled HTTP session.
+
+        :return: None
+        '''
+        self._executor.shutdown(wait=False)
+        self.trader.session.close()
+
+    async def _call(self, method, *args, **kwargs):
+        if self.loop is None:
+            self.loop = asyncio.get_running_loop()
+        return await self.loop.run_in_executor(
+            self._executor, functools.partial(method, *args, **kwargs))
+
+    def _threadsafe(self, handler, decoded=False):
+        '''
+        Wraps handler so that calls made on the socket thread run on the
+        event loop instead. Payloads are still decoded on the socket
+        thread for handlers that take decoded messages.
+        '''
+        if self.loop is None:
+            self.loop = asyncio.get_running_loop()
+        loop = self.loop
+
+        def deliver(msg):
+            result = handler(msg)
+            if asyncio.iscoroutine(result):
+                loop.create_task(result)
+
+        def bridge(msg):
+            loop.call_soon_threadsafe(deliver, msg)
+        bridge.decoded = decoded or getattr(handler, 'decoded', False)
+        return bridge
+
+    async def login(self, timeout=None):
+        '''
+        Logs in and waits until the socket is connected and the
+        on_connect actions (accounts, offers, model subscriptions) are done.
+        The socket comes from trader.socket_factory, so a stand-in can be
+        used (see benchmarks/local_server.FakeSocketIO).
+
+        :param timeout: * Optional * seconds to wait for the connection
+        :return: Dict
+        '''
+        self.loop = asyncio.get_running_loop()
+        connected = self._connected = asyncio.Event()
+        trader = self.trader
+        if self._on_connect is None:
+            # wrapped once, however often login is called
+            self._on_connect = trader.on_connect
+            trader.on_connect = self._connect
+        response = await self._call(trader.login)
+        try:
+            await asyncio.wait_for(connected.wait(), timeout)
+        except asyncio.TimeoutError:
+            return {'status': False, 'data': "Timed out connecting"}
+        return response
+
+    def _connect(self):
+        # runs on the socket thread in place of trader.on_connect
+        try:
+            self._on_connect()
+        finally:
+            connected = self._connected
+            if connected is not None:
+                self.loop.call_soon_threadsafe(connected.set)
+
+    async def logout(self):
+        return await self._call(self.trader.logout)
+
+    async def send(self, location, params={}, method='post',
+                   additional_headers={}):
+        return await self._call(self.trader.send, location, params, method,
+                                additional_headers)
+
+    async def get_model(self, item, fresh=False):
+        return await self._call(self.trader.get_model, item, fresh)
+
+    async def open_trade(self, *args, **kwargs):
+        return await self._call(self.trader.open_trade, *args, **kwargs)
+
+    async def close_trade(self, *args, **kwargs):
+        return await self._call(self.trader.close_trade, *args, **kwargs)
+
+    async def _wait(self, event, timeout):
+        # on the loop's default executor, so long waits do not hold REST
+        # workers
+        if self.loop is None:
+            self.loop = asyncio.get_running_loop()
+        return await self.loop.run_in_executor(None, event.wait, timeout)
+
+    async def wait_ready(self, timeout=None):
+        '''
+        Waits, without blocking the event loop, until the socket is
+        connected and the on_connect actions are done.
+
+        :param timeout: * Optional * seconds
+        :return: True once ready, False on timeout
+        '''
+        return await self._wait(self.trader.ready, timeout)
+
+    async def wait_offers(self, timeout=None):
+        '''
+        Waits, without blocking the event loop, until the offers (and so
+        symbol_info) are loaded.
+
+        :param timeout: * Optional * seconds
+        :return: True once loaded, False on timeout
+        '''
+        return await self._wait(self.trader.offers_loaded, timeout)
+
+    async def order_accepted(self, order_id, timeout=None):
+        '''
+        Waits for the first Order update of order_id.
+
+        :param order_id:
+        :param timeout: * Optional * seconds, raises asyncio.TimeoutError
+        :return: the order's state record
+        '''
+        return await asyncio.wait_for(asyncio.wrap_future(
+            self.trader.order_accepted(order_id)), timeout)
+
+    async def order_filled(self, order_id, timeout=None):
+        '''
+        Waits for order_id to be linked to its trade.
+
+        :param order_id:
+        :param timeout: * Optional * seconds, raises asyncio.TimeoutError
+        :return: tradeId, or None if the order was deleted without one
+        '''
+        return await asyncio.wait_for(asyncio.wrap_future(
+            self.trader.order_filled(order_id)), timeout)
+
+    async def get_candles(self, *args, **kwargs):
+        return await self._call(self.trader.get_candles, *args, **kwargs)
+
+    candles = get_candles
+
+    async def subscribe_symbol(self, instruments, handler=None,
+                               decoded=False, conflate=None):
+        '''
+        Subscribe to given instrument(s). handler (a function or coroutine
+        function taking the message) runs on the event loop; by default
+        the Trader's on_price_update keeps trader.symbols current.
+
+        :param instruments:
+        :param handler: * Optional *
+        :param decoded: True to pass handler the decoded message
+        :param conflate: * Optional * as for Trader.subscribe_symbol
+        :return: response Dict
+        '''
+        handler = self._threadsafe(handler or self.trader.on_price_update,
+                                   decoded)
+        return await self._call(self.trader.subscribe_symbol, instruments,
+                                handler, conflate=conflate)
+
+    async def unsubscribe_symbol(self, instruments):
+        return await self._call(self.trader.unsubscribe_symbol, instruments)
+
+    async def subscribe(self, items, handler=None, decoded=False):
+        '''
+        Subscribe to model updates, with handler run on the event loop.
+
+        :param items:
+        :param handler: * Optional *
+        :param decoded: True to pass handler the decoded message
+        :return: response Dict
+        '''
+        handler = self._threadsafe(handler or self.trader.on_message,
+                                   decoded)
+        return await self._call(self.trader.subscribe, items, handler)
+
+    async def unsubscribe(self, items):
+        return await self._call(self.trader.unsubscribe, items)
+
+    def _tap(self, event, feed, created):
+        '''
+        Adds feed to the streams of socket event. The first stream of an
+        event re-registers its handler wrapped in one that, after the
+        handler, passes the decoded update to every feed of the event, so
+        the Trader's own handling and any number of streams share the one
+        subscription.
+
+        :param created: True if the stream made the subscription
+        '''
+        stream = self._streams.get(event)
+        if stream is not None:
+            stream['feeds'].append(feed)
+            return
+        trader = self.trader
+        handler, decoded, queued = trader.handlers[event]
+        message_of = trader._message
+        feeds = [feed]
+
+        def fan(msg):
+            handler(msg)
+            message = msg if decoded else message_of(msg)
+            for put in feeds:
+                put(message)
+        self._streams[event] = {'feeds': feeds, 'fan': fan, 'created': created,
+                                'handler': (handler, decoded, queued)}
+        trader._on(event, fan, decoded, queued)
+
+    def _untap(self, event, feed):
+        '''
+        Removes feed from the streams of event. Once the last is gone the
+        handler registered before the first stream is put back.
+
+        :return: True if the subscription was made by the streams and
+                 should now be unsubscribed
+        '''
+        stream = self._streams.get(event)
+        if stream is None or feed not in stream['feeds']:
+            return False
+        stream['feeds'].remove(feed)
+        if stream['feeds']:
+            return False
+        del self._streams[event]
+        if self.trader.handlers.get(event, (None,))[0] is not stream['fan']:
+            # unsubscribed or subscribed again since, leave it be
+            return False
+        if stream['created']:
+            return True
+        self.trader._on(event, *stream['handler'])
+        return False
+
+    async def stream_prices(self, instruments, maxsize=1000):
+        '''
+        Yields the decoded price updates of instrument(s) as they arrive,
+        subscribing to those not yet subscribed (with on_price_update, so
+        trader.symbols stays current):
+
+            async for tick in trader.stream_prices(["EUR/USD", "USD/JPY"]):
+                print(tick['Symbol'], tick['Rates'])
+
+        Up to maxsize updates wait for the consumer; past that the oldest
+        is dropped. Closing the stream (leave it with contextlib.aclosing
+        to close it at once) puts back the handlers of instruments that
+        were already subscribed and unsubscribes the others.
+
+        :param instruments:
+        :param maxsize: updates buffered for a slow consumer
+        :return: async iterator of Dict
+        '''
+        self.loop = asyncio.get_running_loop()
+        if type(instruments) is not list:
+            instruments = [instruments]
+        feed = _Feed(self.loop, maxsize, True)
+        missing = [instrument for instrument in instruments
+                   if instrument not in self.trader.handlers]
+        if missing:
+            await self._call(self.trader.subscribe_symbol, missing)
+        try:
+            for instrument in instruments:
+                self._tap(instrument, feed, instrument in missing)
+            while True:
+                yield await feed.get()
+        finally:
+            feed.close()
+            unsubscribe = [instrument for instrument in instruments
+                           if self._untap(instrument, feed)]
+            if unsubscribe:
+                await self._call(self.trader.unsubscribe_symbol, unsubscribe)
+
+    async def stream_model(self, item, maxsize=1000):
+        '''
+        Yields the decoded updates of model item, after the Trader's own
+        handler for item (eg. on_order) has seen them, subscribing to
+        item if it is not yet subscribed:
+
+            async for update in trader.stream_model("Order"):
+                print(update['orderId'], update.get('action'))
+
+        The socket thread never waits for the consumer. Up to maxsize
+        updates are buffered; past that, rather than lose updates
+        silently, the stream ends with StreamOverflow once the buffered
+        ones are consumed, and the consumer can resync from get_model and
+        open a new stream. Closing the stream puts back the handler item
+        had before, or unsubscribes it if the stream subscribed it.
+
+        :param item: model name
+        :param maxsize: updates buffered for a slow consumer
+        :return: async iterator of Dict
+        '''
+        self.loop = asyncio.get_running_loop()
+        feed = _Feed(self.loop, maxsize, False)
+        created = item not in self.trader.handlers
+        if created:
+            response = await self._call(self.trader.subscribe, item,
+                                        self.trader.update_handlers.get(item))
+            if response['status'] is not True:
+                raise RuntimeError("Can't subscribe to %s: %s" % (item,
+                                                                  response))
+        try:
+            self._tap(item, feed, created)
+            while True:
+                yield await feed.get()
+        finally:
+            feed.close()
+            if self._untap(item, feed):
+                await self._call(self.trader.unsubscribe, item)
+
+
+class StreamOverflow(Exception):
+    '''Raised by AsyncTrader.stream_model when its consumer fell more
+    than maxsize updates behind.'''
+
+
+class _Feed(object):
+    '''Bounded buffer between the thread running socket handlers and a
+    stream consumer on the event loop. Calls never block the caller;
+    when the buffer is full the oldest message is dropped (drop) or the
+    feed stops and get raises StreamOverflow once drained.
+    '''
+
+    def __init__(self, loop, maxsize, drop):
+        self.loop = loop
+        self.drop = drop
+        self.buffer = asyncio.Queue(maxsize)
+        self.closed = False
+        self.overflowed = False
+
+    def __call__(self, message):
+        if not self.closed:
+            self.loop.call_soon_threadsafe(self._put, message)
+
+    def _put(self, message):
+        if self.closed or self.overflowed:
+            return
+        if self.buffer.full():
+            if not self.drop:
+                self.overflowed = True
+                return
+            self.buffer.get_nowait()
+        self.buffer.put_nowait(message)
+
+    async def get(self):
+        if self.overflowed and self.buffer.empty():
+            raise StreamOverflow("Stream fell %s updates behind"
+                                 % self.buffer.maxsize)
+        return await self.buffer.get()
+
+    def close(self):
+        self.closed = True
+        while not self.buffer.empty():
+            self.buffer.get_nowait()
@@ -1,13 +1,12 @@
 import json
 import fxcm_rest_api_token as fxcm_rest_api
-import time
 
 trader = fxcm_rest_api.Trader('YOURTOKEN', 'demo') # demo for demo 
 trader.login()
 try:
     print("Logged in, now getting Account details")
-    while len(trader.account_list) < 1:
-           time.sleep(0.1)
+    if not trader.wait_ready(30):
+        raise Exception("Timed out waiting for the connection")
     account_id = trader.account_list[0]
     print(trader.account_id == account_id)
     print("Opening a trade now -USD/JPY 10 lots on %s" % account_id)
@@ -15,7 +14,7 @@ try:
     print(response)
     if response['status'] is True:
         orderId = response['data']['orderId']
-        tradeId = trader.get_tradeId(orderId)
+        tradeId = trader.order_filled(orderId).result(timeout=10)
         print("TradeID: ", tradeId)
         print("Open trade response: ", response)
         positions = trader.get_model("OpenPosition")        
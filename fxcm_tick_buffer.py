@@ -0,0 +1,59 @@
+import numpy as np
+
+
+TICK_DTYPE = [('timestamp', np.int64), ('bid', np.float64),
+              ('ask', np.float64), ('high', np.float64), ('low', np.float64)]
+
+
+class TickBuffer(object):
+    '''Fixed size history of the latest price updates for one symbol.
+    Memory stays at 2 * depth ticks however long the session runs.
+
+    Every tick is written twice, depth rows apart, so the latest n ticks
+    are always one contiguous run of the backing array. last() and
+    since() return that run as a NumPy view, without copying, ready for
+    vectorized calculations (window['bid'], window['ask'], ...).
+    Views read the live buffer: copy them if they are kept while more
+    than depth further ticks arrive.
+    '''
+
+    def __init__(self, depth):
+        if depth < 1:
+            raise ValueError("depth must be at least 1")
+        self.depth = depth
+        self.count = 0
+        self._next = 0
+        self._ticks = np.zeros(2 * depth, dtype=TICK_DTYPE)
+
+    def __len__(self):
+        return min(self.count, self.depth)
+
+    def append(self, timestamp, bid, ask, high, low):
+        '''
+        Adds a tick, replacing the oldest one once depth are held.
+        '''
+        i = self._next
+        tick = (timestamp, bid, ask, high, low)
+        self._ticks[i] = tick
+        self._ticks[i + self.depth] = tick
+        self._next = i + 1 if i + 1 < self.depth else 0
+        self.count += 1
+
+    def last(self, n=None):
+        '''
+        Returns a view of the latest n ticks (all held ticks by default),
+        oldest first.
+        '''
+        held = len(self)
+        n = held if n is None else min(n, held)
+        end = self._next + self.depth
+        return self._ticks[end - n:end]
+
+    def since(self, timestamp):
+        '''
+        Returns a view of the held ticks updated at or after timestamp,
+        oldest first.
+        '''
+        ticks = self.last()
+        first = np.searchsorted(ticks['timestamp'], timestamp, 'left')
+        return ticks[first:]